@@ -2,7 +2,6 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import asyncore
 import socket
 import os
 import sys
@@ -15,6 +14,7 @@ from jsobjects import JSObject
 parent = os.path.abspath(os.path.dirname(__file__))
 extension_path = os.path.join(parent, 'extension')
 wait_to_create_timeout = 60
+poll_interval = .05
 
 
 def find_port():
@@ -39,18 +39,23 @@ def wait_and_create_network(host, port, timeout=wait_to_create_timeout):
             break
         except socket.error:
             pass
-        sleep(.25)
+        sleep(poll_interval)
     if not connected:
         raise Exception("Cannot connect to jsbridge extension, port %s" % port)
 
-    back_channel, bridge = create_network(host, port)
-    sleep(.5)
+    while True:
+        back_channel, bridge = create_network(host, port)
+
+        # the server accepts connections as soon as they come in, so both
+        # channels register right away unless a connection got lost
+        register_deadline = datetime.now() + timedelta(seconds=1)
+        while datetime.now() < register_deadline:
+            if back_channel.registered and bridge.registered:
+                return back_channel, bridge
+            sleep(poll_interval)
 
-    while back_channel.registered is False:
         back_channel.close()
         bridge.close()
-        asyncore.socket_map = {}
-        sleep(1)
-        back_channel, bridge = create_network(host, port)
-
-    return back_channel, bridge
+        if datetime.now() > deadline:
+            raise Exception("Cannot register with jsbridge extension, "
+                            "port %s" % port)
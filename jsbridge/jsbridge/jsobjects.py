@@ -40,7 +40,7 @@ def create_jsobject(bridge, fullname, value=None, obj_type=None,
     override_set -- Override the name of the object
 
     """
-    description = bridge.describe(fullname)
+    description = bridge.describe(fullname, attributes=False)
     obj_type = description['type']
     value = description.get('data', None)
 
@@ -81,9 +81,13 @@ class JSObject(object):
         result = create_jsobject(self._bridge_, name, override_set=True)
         return result
 
-    def __attributes__(self):
-        """Returns the attributes in the object."""
-        return self._bridge_.describe(self._name_)['attributes']
+    def __attributes__(self, **options):
+        """Returns the attributes in the object.
+
+        Keyword arguments filter the attribute names, see Bridge.describe.
+
+        """
+        return self._bridge_.describe(self._name_, **options)['attributes']
 
     def __iter__(self):
         for i in self.__attributes__():
@@ -99,7 +103,7 @@ class JSObject(object):
             # A little hack so that ipython returns all the names.
             return self.__attributes__
 
-        if name in self.__attributes__():
+        if self._bridge_.has(self._name_, name):
             return self.__jsget__(self._name_ + '["' + name + '"]')
         else:
             raise AttributeError(name + " is undefined.")
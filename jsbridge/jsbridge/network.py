@@ -7,8 +7,8 @@ import inspect
 import socket
 import select
 import uuid
-from time import sleep
-from threading import Thread
+from time import sleep, time
+from threading import Condition, Thread
 
 try:
     import json as simplejson
@@ -23,6 +23,10 @@ class JavaScriptException(Exception):
 
 
 class Telnet(asyncore.dispatcher):
+    # traffic of the connection
+    bytes_sent = 0
+    bytes_received = 0
+
     def __init__(self, host, port):
         self.host, self.port = host, port
         asyncore.dispatcher.__init__(self)
@@ -48,6 +52,11 @@ class Telnet(asyncore.dispatcher):
         sent = self.send(self.buffer)
         self.buffer = self.buffer[sent:]
 
+    def send(self, data):
+        sent = asyncore.dispatcher.send(self, data)
+        self.bytes_sent += sent or 0
+        return sent
+
     def read_all(self):
         import socket
 
@@ -62,6 +71,7 @@ class Telnet(asyncore.dispatcher):
 
     def handle_read(self):
         self.data = self.read_all()
+        self.bytes_received += len(self.data)
         self.process_read(self.data)
 
     read_callback = lambda self, data: None
@@ -126,10 +136,50 @@ class JSObjectEncoder(simplejson.JSONEncoder):
 encoder = JSObjectEncoder()
 
 
+def encode_command(op, _uuid, target=None, args=()):
+    """Encode a structured command for the jsbridge session.
+
+    The session dispatches the command straight to the Bridge method `op`
+    instead of compiling it as a new JavaScript program. Returns None if the
+    arguments can't be expressed as JSON, e.g. because they reference
+    JavaScript objects by name. Callers have to fall back to an eval'd
+    string in that case.
+
+    Arguments:
+    op -- Name of the Bridge method to call
+    _uuid -- UUID of the callback to be fired
+
+    Keyword arguments:
+    target -- JavaScript expression of the object the command operates on
+    args -- Additional arguments to the Bridge method
+
+    """
+    command = {'op': op, 'uuid': _uuid, 'args': list(args)}
+    if target is not None:
+        command['target'] = target
+
+    try:
+        return simplejson.dumps(command)
+    except (TypeError, ValueError):
+        return None
+
+
 class JSBridgeDisconnectError(Exception):
     """exception raised when an unexpected disconect happens"""
 
 
+class JSBridgeCrashError(JSBridgeDisconnectError):
+    """exception raised when the application exited while waiting for it"""
+
+    def __init__(self, exit_code):
+        self.exit_code = exit_code
+        if exit_code < 0:
+            message = 'Application killed by signal %d' % -exit_code
+        else:
+            message = 'Application exited with code %d' % exit_code
+        JSBridgeDisconnectError.__init__(self, message)
+
+
 class Bridge(Telnet):
     trashes = []
     reading = False
@@ -137,6 +187,8 @@ class Bridge(Telnet):
     events_list = []
 
     callbacks = {}
+    # notified whenever a callback has been received
+    callback_received = Condition()
 
     bridge_type = "bridge"
 
@@ -145,6 +197,16 @@ class Bridge(Telnet):
     # global timeout counter
     timeout_ctr = 0.
 
+    # called with the command, start and end time of each round trip
+    trace = None
+
+    # number of completed round trips
+    round_trips = 0
+
+    # called while waiting for a callback, returns the exit code of the
+    # application once it has exited unexpectedly, otherwise None
+    exit_status = None
+
     def __init__(self, host, port, timeout=60.):
         """
         - timeout : failsafe timeout for each call to run in seconds
@@ -161,6 +223,7 @@ class Bridge(Telnet):
 
     def run(self, _uuid, exec_string, interval=.2, raise_exeption=True):
         socket_error = None
+        sent = time()
 
         exec_string += '\r\n'
         try:
@@ -169,13 +232,34 @@ class Bridge(Telnet):
             print str(e)
             print "String: %s" % exec_string
 
-        while _uuid not in self.callbacks.keys():
-            Bridge.timeout_ctr += interval
+        while True:
+            # wait for the callback to arrive, but wake up regularly to
+            # check for timeouts and disconnects
+            started = time()
+            self.callback_received.acquire()
+            try:
+                if _uuid not in self.callbacks:
+                    self.callback_received.wait(interval)
+            finally:
+                self.callback_received.release()
+
+            if _uuid in self.callbacks:
+                break
+
+            if self.exit_status:
+                exit_code = self.exit_status()
+                # only an error code or a signal is a crash
+                if exit_code:
+                    raise JSBridgeCrashError(exit_code)
+                elif exit_code is not None:
+                    raise JSBridgeDisconnectError(
+                        "Application exited unexpectedly")
+
+            Bridge.timeout_ctr += time() - started
             if Bridge.timeout_ctr > self.timeout:
                 print 'Timeout: %s' % exec_string
                 raise JSBridgeDisconnectError("Connection timed out")
 
-            sleep(interval)
             try:
                 self.send('')
             except socket.error:
@@ -187,6 +271,10 @@ class Bridge(Telnet):
 
         # reset the counter
         Bridge.timeout_ctr = 0.
+        self.round_trips += 1
+
+        if self.trace:
+            self.trace(exec_string.rstrip(), sent, time())
 
         callback = self.callbacks.pop(_uuid)
         if callback['result'] is False and raise_exeption is True:
@@ -195,38 +283,63 @@ class Bridge(Telnet):
 
     def register(self):
         _uuid = str(uuid.uuid1())
-        self.send('bridge.register("' + _uuid + '", "' +
-                  self.bridge_type + '")\r\n')
+        self.send(encode_command('register', _uuid, args=[self.bridge_type])
+                  + '\r\n')
         self.registered = True
 
     def execFunction(self, func_name, args, interval=.25):
         _uuid = str(uuid.uuid1())
-        exec_args = [encoder.encode(_uuid), func_name, encoder.encode(args)]
-        return self.run(_uuid, 'bridge.execFunction(' +
-                        ', '.join(exec_args) + ')', interval)
+        command = encode_command('execFunction', _uuid, func_name, [args])
+        if command is None:
+            exec_args = [encoder.encode(_uuid), func_name,
+                         encoder.encode(args)]
+            command = 'bridge.execFunction(' + ', '.join(exec_args) + ')'
+        return self.run(_uuid, command, interval)
 
     def setAttribute(self, obj_name, name, value):
         _uuid = str(uuid.uuid1())
-        exec_args = [encoder.encode(_uuid), obj_name,
-                     encoder.encode(name), encoder.encode(value)]
-        return self.run(_uuid, 'bridge.setAttribute('
-                        + ', '.join(exec_args) + ')')
+        command = encode_command('setAttribute', _uuid, obj_name,
+                                 [name, value])
+        if command is None:
+            exec_args = [encoder.encode(_uuid), obj_name,
+                         encoder.encode(name), encoder.encode(value)]
+            command = 'bridge.setAttribute(' + ', '.join(exec_args) + ')'
+        return self.run(_uuid, command)
 
     def set(self, obj_name):
         _uuid = str(uuid.uuid1())
-        return self.run(_uuid, 'bridge.set(' +
-                        ', '.join([encoder.encode(_uuid), obj_name]) + ')')
+        return self.run(_uuid, encode_command('set', _uuid, obj_name))
 
-    def describe(self, obj_name):
+    def describe(self, obj_name, **options):
+        """Describe the named object.
+
+        Keyword arguments are passed on as options to filter the
+        attribute names: attributes (False to skip them), own, prefix,
+        offset and limit.
+
+        """
         _uuid = str(uuid.uuid1())
-        return self.run(_uuid, 'bridge.describe(' +
-                        ', '.join([encoder.encode(_uuid), obj_name]) + ')')
+        args = [options] if options else []
+        return self.run(_uuid, encode_command('describe', _uuid, obj_name,
+                                              args))
+
+    def has(self, obj_name, name):
+        """Check whether the named object has the given attribute."""
+        _uuid = str(uuid.uuid1())
+        return self.run(_uuid, encode_command('has', _uuid, obj_name,
+                                              [name]))['data']
 
     def fire_callbacks(self, obj):
         if 'uuid' not in obj and 'exception' in obj:
             # harness failure
             raise JavaScriptException(obj['exception']['message'])
-        self.callbacks[obj['uuid']] = obj
+
+        self.callback_received.acquire()
+        try:
+            self.callbacks[obj['uuid']] = obj
+            self.callback_received.notifyAll()
+        finally:
+            self.callback_received.release()
 
     def process_read(self, data):
         """Parse out json objects and fire callbacks."""
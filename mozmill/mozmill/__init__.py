@@ -4,6 +4,7 @@
 
 
 import os
+import Queue
 import socket
 import sys
 import traceback
@@ -13,20 +14,32 @@ except:
     import simplejson as json
 
 import jsbridge
-import mozinfo
 import mozrunner
+import cache
 import handlers
+import python_callbacks
 
 from datetime import datetime
-from jsbridge.network import JSBridgeDisconnectError
+from jsbridge.network import JSBridgeCrashError, JSBridgeDisconnectError
 from manifestparser import TestManifest
-from mozrunner.utils import get_metadata_from_egg
+from mozmill import trace as tracing
 from optparse import OptionGroup
-from time import sleep
+from threading import Event
+from time import time
 
 
-# metadata
-package_metadata = get_metadata_from_egg('mozmill')
+# metadata, looked up when first needed since pkg_resources is slow to
+# import
+package_metadata = None
+
+
+def get_package_metadata():
+    global package_metadata
+    if package_metadata is None:
+        from mozrunner.utils import get_metadata_from_egg
+        package_metadata = get_metadata_from_egg('mozmill')
+    return package_metadata
+
 
 js_module_template = 'Components.utils.import("resource://mozmill/%s")'
 js_module_frame = js_module_template % 'modules/frame.js'
@@ -39,22 +52,46 @@ extension_path = os.path.join(basedir, 'extension')
 ADDONS = [extension_path, jsbridge.extension_path]
 JSBRIDGE_TIMEOUT = 60.
 
+# seconds the runner is waited for to stop once the shutdown timeout has
+# been used up
+SHUTDOWN_MIN_WAIT = 1.
+
 
 class TestResults(object):
-    """Class to accumulate test results and other information."""
-    def __init__(self):
+    """Class to accumulate test results and other information.
+
+    Tests are kept as compact records. With a journal the results are
+    stored on disk instead, and the lists of tests and screenshots are
+    sequences reading them back one at a time.
+
+    """
+    def __init__(self, journal_path=None):
         # application information
         self.appinfo = {}
 
+        # on-disk storage of the results
+        self.journal = None
+        sequence = list
+        if journal_path:
+            import journal
+            self.journal = journal.Journal(journal_path)
+            sequence = lambda: journal.Records(self.journal)
+
         # other information
-        self.mozmill_version = package_metadata.get('Version')
-        self.screenshots = []
+        self.mozmill_version = get_package_metadata().get('Version')
+        self.screenshots = sequence()
 
         # test statistics
-        self.alltests = []
-        self.fails = []
-        self.passes = []
-        self.skipped = []
+        self.alltests = sequence()
+        self.fails = sequence()
+        self.passes = sequence()
+        self.skipped = sequence()
+
+        # timing and harness overhead of the test files
+        self.testfiles = sequence()
+
+        # number of events by type the application didn't send
+        self.dropped_events = {}
 
         # total test run time
         self.starttime = datetime.utcnow()
@@ -62,33 +99,70 @@ class TestResults(object):
 
     def events(self):
         """Events, the MozMill class will dispatch to."""
-        return {'mozmill.endTest': self.endTest_listener}
+        return {'mozmill.endTest': self.endTest_listener,
+                'mozmill.endTestFile': self.endTestFile_listener,
+                'mozmill.droppedEvents': self.droppedEvents_listener,
+                'mozmill.disconnect': self.disconnect_listener}
 
     def finish(self, handlers, fatal=False):
         """Do the final reporting and such."""
         self.endtime = datetime.utcnow()
 
         # handle stop events
+        mozmill = getattr(self, 'mozmill', None)
         for handler in handlers:
             if hasattr(handler, 'stop'):
-                handler.stop(self, fatal)
+                span = tracing.null_span
+                if mozmill is not None:
+                    span = mozmill.trace('%s.stop' % handler.__class__.__name__)
+                with span:
+                    handler.stop(self, fatal)
+
+        # the results can't be read anymore once the journal is closed
+        if self.journal:
+            self.journal.close()
+
+    def add(self, test, category):
+        """Add a test to all tests and to the given category."""
+        if self.journal:
+            offset = self.journal.write(test)
+            self.alltests.add(offset)
+            category.add(offset)
+        else:
+            import records
+            test = records.TestRecord(test)
+            self.alltests.append(test)
+            category.append(test)
 
     ### event listener
     def endTest_listener(self, test):
         """Add current test result to results."""
-        self.alltests.append(test)
         if test.get('skipped', False):
-            self.skipped.append(test)
+            self.add(test, self.skipped)
         elif test['failed'] > 0:
             if self.mozmill.running_test.get('expected') == 'fail':
-                self.passes.append(test)
+                self.add(test, self.passes)
             else:
-                self.fails.append(test)
+                self.add(test, self.fails)
         else:
             if self.mozmill.running_test.get('expected') == 'fail':
-                self.fails.append(test)
+                self.add(test, self.fails)
             else:
-                self.passes.append(test)
+                self.add(test, self.passes)
+
+    def endTestFile_listener(self, obj):
+        """Add the timing of the finished test file."""
+        self.testfiles.append(obj)
+
+    def droppedEvents_listener(self, obj):
+        """Add up the events which have been dropped by the application."""
+        for event, count in obj.items():
+            self.dropped_events[event] = (self.dropped_events.get(event, 0) +
+                                          count)
+
+    def disconnect_listener(self, test):
+        """Add the test which was running during a disconnect as failure."""
+        self.add(test, self.fails)
 
 
 class MozMill(object):
@@ -104,7 +178,8 @@ class MozMill(object):
     @classmethod
     def create(cls, results=None, jsbridge_timeout=JSBRIDGE_TIMEOUT,
                handlers=(), app='firefox', profile_args=None,
-               runner_args=None):
+               runner_args=None, profile_pool=0, application_pool=0,
+               tracer=None, hang_timeout=0):
 
         jsbridge_port = jsbridge.find_port()
 
@@ -118,7 +193,8 @@ class MozMill(object):
         # get the necessary arguments to construct the profile and
         # runner instance
         profile_args = profile_args or {}
-        profile_args.setdefault('addons', []).extend(ADDONS)
+        addons = profile_args.setdefault('addons', [])
+        addons.extend([addon for addon in ADDONS if addon not in addons])
 
         preferences = profile_args.setdefault('preferences', {})
         if isinstance(preferences, dict):
@@ -136,10 +212,15 @@ class MozMill(object):
 
         # create a mozmill
         return cls(runner, jsbridge_port, results=results,
-                   jsbridge_timeout=jsbridge_timeout, handlers=handlers)
+                   jsbridge_timeout=jsbridge_timeout, handlers=handlers,
+                   profile_pool=profile_pool,
+                   application_pool=application_pool, tracer=tracer,
+                   hang_timeout=hang_timeout)
 
     def __init__(self, runner, jsbridge_port, results=None,
-                 jsbridge_timeout=JSBRIDGE_TIMEOUT, handlers=()):
+                 jsbridge_timeout=JSBRIDGE_TIMEOUT, handlers=(),
+                 profile_pool=0, application_pool=0, tracer=None,
+                 hang_timeout=0):
         """Constructor of the Mozmill class.
 
         Arguments:
@@ -150,11 +231,32 @@ class MozMill(object):
         results -- A TestResults instance to accumulate results
         jsbridge_timeout -- How long to wait without a jsbridge communication
         handlers -- pluggable event handlers
+        profile_pool -- Number of clean profiles to keep ready for restarts
+                        between test files (0 disables the pool)
+        application_pool -- Number of applications to start ahead of the
+                            test files using them in restart mode
+                            (0 disables the pool)
+        tracer -- Tracer instance to record the harness phases with
+        hang_timeout -- Seconds a test may go without any progress before
+                        the application gets killed (0 disables the
+                        watchdog)
 
         """
         # the MozRunner
         self.runner = runner
 
+        # clean profiles for restarts, created on the first restart run
+        self.profile_pool_size = profile_pool
+        self.profile_pool = None
+        self.profile_template = None
+
+        # started applications for restarts
+        self.application_pool_size = application_pool
+        self.application_pool = None
+
+        # timeline of the harness phases
+        self.tracer = tracer
+
         # execution parameters
         self.debugger = None
         self.interactive = False
@@ -167,28 +269,53 @@ class MozMill(object):
         # Report data will end up here
         self.results = results or TestResults()
 
-        # persisted data
+        # persisted data, and its version known to the application
         self.persisted = {}
+        self.persisted_version = 0
+
+        # test files of the current batch, the position of the running one
+        # within the batch, and the running one; a file may be listed twice
+        self.batch = []
+        self.batch_index = None
+        self.running_test = None
+
+        # bridge traffic when the running test function has been started
+        self.test_traffic = None
 
         # shutdown parameters
         self.shutdownMode = {}
+        self.watch_process = False
         self.endRunnerCalled = False
+        self.drained = Event()
 
         # setup event listeners
         self.global_listeners = []
         self.listeners = []
         # dict of listeners by event type
         self.listener_dict = {}
+
+        # kills the application when a test hangs
+        self.watchdog = None
+        if hang_timeout:
+            import watchdog
+            self.watchdog = watchdog.Watchdog(self, hang_timeout)
+            self.add_global_listener(self.watchdog)
+        self.add_listener(self.drained_listener,
+                          eventType='mozmill.drained')
         self.add_listener(self.endRunner_listener,
                           eventType='mozmill.endRunner')
+        self.add_listener(self.endTest_listener,
+                          eventType='mozmill.endTest')
         self.add_listener(self.frameworkFail_listener,
                           eventType='mozmill.frameworkFail')
-        self.add_listener(self.persist_listener,
-                          eventType="mozmill.persist")
+        self.add_listener(self.persistDelta_listener,
+                          eventType="mozmill.persistDelta")
         self.add_listener(self.screenshot_listener,
                           eventType='mozmill.screenshot')
         self.add_listener(self.startTest_listener,
                           eventType='mozmill.setTest')
+        self.add_listener(self.startTestFile_listener,
+                          eventType='mozmill.setTestFile')
         self.add_listener(self.userShutdown_listener,
                           eventType='mozmill.userShutdown')
 
@@ -218,15 +345,78 @@ class MozMill(object):
     def add_global_listener(self, callback):
         self.global_listeners.append(callback)
 
-    def persist_listener(self, obj):
-        self.persisted = obj
+    def subscriptions(self):
+        """Returns the event types which have listeners.
+
+        Global listeners declare the events they need with a
+        `subscriptions` method. If any of them doesn't, or returns None
+        from it, all events are needed and None is returned.
+
+        """
+        types = set(self.listener_dict.keys())
+        for callback in self.global_listeners:
+            if not hasattr(callback, 'subscriptions'):
+                return None
+
+            subscribed = callback.subscriptions()
+            if subscribed is None:
+                return None
+            types.update(subscribed)
+
+        return sorted(types)
+
+    def persistDelta_listener(self, obj):
+        # deltas arrive in order on the back channel, so their base is the
+        # version which has been sent to the application or the last delta,
+        # unless they come from an application which didn't get that version
+        if obj['base'] != self.persisted_version:
+            return
+
+        self.apply_persisted_delta(obj)
+
+    def apply_persisted_delta(self, obj):
+        """Apply the changes of a persistDelta event to the persisted data."""
+        for key, value in obj['changed'].items():
+            self.persisted[key] = value
+        for key in obj['deleted']:
+            self.persisted.pop(key, None)
+        self.persisted_version = obj['version']
 
     def startTest_listener(self, test):
         self.current_test = test
 
+        # events forwarded from shards come with the traffic of the shard
+        self.test_traffic = None
+        if self.bridge is not None:
+            self.test_traffic = self.traffic()
+
+    def endTest_listener(self, test):
+        # runs ahead of the handlers, so the results include the overhead
+        if self.test_traffic is None:
+            return
+
+        test.update(self.traffic_since(self.test_traffic))
+        self.test_traffic = None
+
+    def startTestFile_listener(self, obj):
+        # the files of a batch are announced with their position as they
+        # get started
+        index = obj.get('index')
+        if (index is None or index == self.batch_index or
+            index >= len(self.batch) or
+            self.batch[index]['path'] != obj['filename']):
+            return
+
+        self.end_test_file()
+        self.batch_index = index
+        self.start_test_file(self.batch[index])
+
     def frameworkFail_listener(self, obj):
         self.framework_failure = obj['message']
 
+    def drained_listener(self, obj):
+        self.drained.set()
+
     def endRunner_listener(self, obj):
         self.endRunnerCalled = True
 
@@ -253,7 +443,10 @@ class MozMill(object):
         """Fire an event from the python side."""
 
         # namespace the event
-        event = 'mozmill.' + event
+        self.dispatch_event('mozmill.' + event, obj)
+
+    def dispatch_event(self, event, obj):
+        """Dispatch a namespaced event to all its listeners."""
 
         # global listeners
         for callback in self.global_listeners:
@@ -265,12 +458,28 @@ class MozMill(object):
 
     ### methods for startup
 
+    def trace(self, name, **args):
+        """Returns a context manager recording the time spent in its block."""
+        if self.tracer is None:
+            return tracing.null_span
+        return self.tracer.span(name, **args)
+
     def create_network(self):
 
         # get the bridge and the back-channel
-        self.back_channel, \
-        self.bridge = jsbridge.wait_and_create_network("127.0.0.1",
-                                                       self.jsbridge_port)
+        with self.trace('create_network'):
+            self.attach_network(*jsbridge.wait_and_create_network(
+                    "127.0.0.1", self.jsbridge_port))
+
+    def attach_network(self, back_channel, bridge):
+        """Use the given back channel and bridge for the application."""
+
+        self.back_channel = back_channel
+        self.bridge = bridge
+        if self.tracer:
+            self.bridge.trace = self.tracer.round_trip
+        self.bridge.exit_status = self.exit_status
+
         # set a timeout on jsbridge actions in order to ensure termination
         self.back_channel.timeout = self.bridge.timeout = self.jsbridge_timeout
 
@@ -295,14 +504,22 @@ class MozMill(object):
     def start_runner(self):
         """Start the MozRunner."""
 
+        # switch to an application which has been started ahead, unless
+        # the current one is restarted by the test
+        switch = self.application_pool is not None and not self.shutdownMode
+
         # if user restart we don't need to start the browser back up
-        if not (self.shutdownMode.get('user', False)
-                and self.shutdownMode.get('restart', False)):
+        if switch:
+            with self.trace('switch_application'):
+                self.switch_application()
+        elif not (self.shutdownMode.get('user', False)
+                  and self.shutdownMode.get('restart', False)):
             if self.shutdownMode.get('resetProfile'):
                 # reset the profile
-                self.runner.reset()
-            self.runner.start(debug_args=self.debugger,
-                              interactive=self.interactive)
+                self.reset_profile()
+            with self.trace('runner.start'):
+                self.runner.start(debug_args=self.debugger,
+                                  interactive=self.interactive)
 
         # set initial states for next test
         self.framework_failure = None
@@ -310,17 +527,46 @@ class MozMill(object):
         self.endRunnerCalled = False
 
         # create the network
-        self.create_network()
+        if not switch:
+            self.create_network()
+
+        # an application which restarted itself may run in a new process,
+        # which can't be watched
+        process = self.application_process()
+        self.watch_process = process is not None and process.poll() is None
+
+        # fetch the application info, unless known from a previous run
+        if not self.results.appinfo:
+            self.results.appinfo = self.cached_appinfo()
 
-        # fetch the application info
+            # the startup info belongs to this start of the application
+            if self.results.appinfo:
+                with self.trace('get_startupinfo'):
+                    startup_info = self.get_startupinfo(self.bridge)
+                self.results.appinfo['startupinfo'] = startup_info
         if not self.results.appinfo:
-            self.results.appinfo = self.get_appinfo(self.bridge)
+            with self.trace('get_appinfo'):
+                self.results.appinfo = self.get_appinfo(self.bridge)
+            binary = getattr(self.runner, 'binary', None)
+            if self.results.appinfo and binary:
+                cache.set_appinfo(binary, self.runner.profile.profile,
+                                  self.results.appinfo)
 
         try:
             frame = jsbridge.JSObject(self.bridge, js_module_frame)
 
-            # transfer persisted data
-            frame.persisted = self.persisted
+            # only the events with listeners are sent by the application
+            subscriptions = self.subscriptions()
+            if subscriptions is not None:
+                self.bridge.execFunction(js_module_frame + '.setSubscriptions',
+                                         [subscriptions])
+
+            # transfer persisted data, unless there is none yet
+            if self.persisted or self.persisted_version:
+                with self.trace('persisted'):
+                    self.bridge.execFunction(js_module_frame + '.setPersisted',
+                                             [self.persisted,
+                                              self.persisted_version])
         except:
             self.report_disconnect(self.framework_failure)
             raise
@@ -337,20 +583,138 @@ class MozMill(object):
         name -- Name of test to run (if None, run all tests)
 
         """
-        try:
-            frame.runTestFile(path, False, name)
-        except JSBridgeDisconnectError:
-            # if the runner is restarted via JS, run this test
-            # again if the next is specified
-            nextTest = self.shutdownMode.get('next')
-            if not nextTest:
-                # if there is not a next test,
-                # throw the error up the chain
-                raise
-            frame = self.run_test_file(self.start_runner(), path, nextTest)
+        while True:
+            try:
+                frame.runTestFile(path, False, name)
+                return frame
+            except JSBridgeDisconnectError:
+                # if the runner is restarted via JS, run this test
+                # again if the next is specified
+                name = self.shutdownMode.get('next')
+                if not name:
+                    # if there is not a next test,
+                    # throw the error up the chain
+                    raise
+                frame = self.restart_application(path, name)
+
+    def run_test_files(self, frame, tests):
+        """Run a batch of test files in a single call.
+
+        The files share the application and the test server. Their
+        results are reported as they would be by separate calls.
+
+        Arguments:
+        frame -- JS frame object
+        tests -- Tests (array) which have to be executed
+
+        """
+        while tests:
+            self.batch = tests
+            self.batch_index = 0
+            self.start_test_file(tests[0])
+            try:
+                frame.runTestFiles([test['path'] for test in tests], False)
+                break
+            except JSBridgeDisconnectError:
+                # if the runner is restarted via JS, finish the running test
+                # file and continue with the files after it
+                nextTest = self.shutdownMode.get('next')
+                if not nextTest:
+                    raise
+
+                test = self.running_test
+                index = self.batch_index
+                frame = self.run_test_file(
+                    self.restart_application(test['path'], nextTest),
+                    test['path'], nextTest)
+
+                tests = tests[index + 1:]
+                if tests:
+                    self.end_test_file()
+
+        return frame
+
+    def restart_application(self, path, name):
+        """Reconnect to the application after a restart by a test.
+
+        The latency from the disconnect until the application is ready
+        again is reported with a `mozmill.restart` event.
+
+        Arguments:
+        path -- Path to the test file which restarted the application
+        name -- Name of the test to continue with
 
+        Returns the new JS frame object.
+
+        """
+        started = time()
+
+        # unless the application restarts itself, the old instance has to
+        # be gone before a new one can use the profile
+        if not (self.shutdownMode.get('user', False) and
+                self.shutdownMode.get('restart', False)):
+            self.runner.wait(timeout=self.jsbridge_timeout)
+
+        with self.trace('restart', path=path, next=name):
+            frame = self.start_runner()
+
+        latency = time() - started
+        if self.running_test is not None:
+            self.test_file_restarts.append(latency)
+        self.fire_event('restart', {'filename': path, 'next': name,
+                                    'latency': latency})
         return frame
 
+    def traffic(self):
+        """Returns the round trips and the bytes sent and received through
+        the bridge and the back channel so far."""
+        if self.bridge is None:
+            return (0, 0, 0)
+
+        return (self.bridge.round_trips,
+                self.bridge.bytes_sent + self.back_channel.bytes_sent,
+                self.bridge.bytes_received + self.back_channel.bytes_received)
+
+    def traffic_since(self, traffic):
+        """Returns the traffic since an earlier snapshot as dictionary."""
+        # the counters start over with the network of a restarted application
+        current = self.traffic()
+        if [value for value, old in zip(current, traffic) if value < old]:
+            traffic = (0, 0, 0)
+
+        return dict(zip(('round_trips', 'bytes_sent', 'bytes_received'),
+                        [value - old for value, old in zip(current, traffic)]))
+
+    def start_test_file(self, test):
+        self.running_test = test
+        self.test_file_started = time()
+        self.test_file_traffic = self.traffic()
+        self.test_file_restarts = []
+        self.test_file_failures = len(self.results.fails)
+
+    def end_test_file(self):
+        if self.running_test is None:
+            return
+
+        ended = time()
+        if self.tracer:
+            self.tracer.add('run_test_file', 'harness', self.test_file_started,
+                            ended, {'path': self.running_test['path']})
+
+        # timestamps and duration in milliseconds like the ones of the test
+        # functions
+        time_start = int(self.test_file_started * 1000)
+        time_end = int(ended * 1000)
+        obj = {'path': self.running_test['path'],
+               'time_start': time_start,
+               'time_end': time_end,
+               'duration': time_end - time_start,
+               'failed': len(self.results.fails) - self.test_file_failures,
+               'restarts': self.test_file_restarts}
+        obj.update(self.traffic_since(self.test_file_traffic))
+        self.fire_event('endTestFile', obj)
+        self.running_test = None
+
     def run(self, tests, restart=False):
         """Run all the tests.
 
@@ -364,14 +728,40 @@ class MozMill(object):
         try:
             frame = None
 
+            # the profile is still clean before the first start, later runs
+            # start with a clone of the template of the first one
+            if (restart and
+                (self.profile_pool_size or self.application_pool_size) and
+                self.profile_pool is None and
+                getattr(self.runner.profile, 'create_new', False)):
+                import pool
+                self.profile_pool = pool.ProfilePool(
+                    self.profile_template or self.runner.profile.profile,
+                    self.profile_pool_size,
+                    {'extensions.jsbridge.port': self.jsbridge_port})
+
+                if self.profile_template:
+                    self.runner.profile = self.profile_pool.profile(
+                        self.runner.profile.__class__)
+                self.profile_template = self.profile_pool.template
+
+                # applications are started in the background, which is not
+                # possible while they are attached to a debugger
+                if self.application_pool_size and not self.debugger:
+                    self.application_pool = pool.ApplicationPool(
+                        self.create_pooled_runner, self.application_pool_size)
+
+            if self.watchdog:
+                self.watchdog.start()
+
             # run tests
             tests = list(tests)
             while tests:
                 test = tests.pop(0)
-                self.running_test = test
 
                 # skip test
                 if 'disabled' in test:
+                    self.running_test = test
 
                     # see frame.js:events.endTest
                     obj = {'filename': test['path'],
@@ -388,9 +778,32 @@ class MozMill(object):
                     self.fire_event('endTest', obj)
                     continue
 
+                # unchanged since it last passed
+                if test.get('cached'):
+                    self.running_test = test
+                    obj = {'filename': test['path'],
+                           'passed': 0,
+                           'failed': 0,
+                           'passes': [],
+                           'fails': [],
+                           'name': os.path.basename(test['path']),
+                           'cached': True
+                    }
+                    self.fire_event('endTest', obj)
+                    continue
+
+                # without restarts the following test files run in a batch
+                batch = [test]
+                while (not restart and tests and
+                       'disabled' not in tests[0] and
+                       not tests[0].get('cached')):
+                    batch.append(tests.pop(0))
+
+                self.batch = []
+                self.batch_index = None
                 try:
-                    frame = self.run_test_file(frame or self.start_runner(),
-                                               test['path'])
+                    frame = self.run_test_files(frame or self.start_runner(),
+                                                batch)
 
                     # If a restart is requested between each test stop the runner
                     # and reset the profile
@@ -398,15 +811,35 @@ class MozMill(object):
                         self.stop_runner()
                         frame = None
 
-                        self.runner.reset()
+                        # the next application comes with a clean profile
+                        if self.application_pool is None:
+                            self.reset_profile()
 
-                except JSBridgeDisconnectError:
+                except JSBridgeDisconnectError, e:
                     frame = None
 
                     # Unexpected shutdown
-                    if not self.shutdownMode:
-                        self.report_disconnect()
+                    if self.watchdog and self.watchdog.hang:
+                        hang = self.watchdog.hang
+                        self.watchdog.hang = None
+                        self.report_disconnect(
+                            'Hang Error: No progress for %d seconds' %
+                            hang['idle'], hang=hang)
                         self.stop_runner()
+                    elif not self.shutdownMode:
+                        if isinstance(e, JSBridgeCrashError):
+                            self.report_disconnect('Crash Error: %s' % e,
+                                                   exit_code=e.exit_code)
+                        else:
+                            self.report_disconnect()
+                        self.stop_runner()
+
+                    # the files of the batch after the failed one still
+                    # have to be run
+                    if self.batch_index is not None:
+                        tests[:0] = self.batch[self.batch_index + 1:]
+
+                self.end_test_file()
 
             # stop the runner
             if frame:
@@ -415,6 +848,8 @@ class MozMill(object):
         finally:
             # shutdown the test harness cleanly
             self.running_test = None
+            if self.watchdog:
+                self.watchdog.stop()
             self.stop()
 
         return self.results
@@ -433,55 +868,139 @@ class MozMill(object):
 
         return app_info
 
+    def get_startupinfo(self, bridge):
+        """Collect the startup times of the application."""
+        startup_info = None
+
+        try:
+            mozmill = jsbridge.JSObject(bridge, js_module_mozmill)
+            startup_info = json.loads(mozmill.getStartupDetails())
+        except JSBridgeDisconnectError:
+            # start_runner() will handle the disconnect with its next call
+            pass
+
+        return startup_info
+
+    def exit_status(self):
+        """Returns the exit code of the application if it has exited
+        unexpectedly, otherwise None."""
+        # exits are expected while the application gets shut down
+        process = self.application_process()
+        if self.shutdownMode or not self.watch_process or process is None:
+            return None
+        return process.poll()
+
+    def application_process(self):
+        """Returns the process of the runner, or None if not started."""
+        process_handler = getattr(self.runner, 'process_handler', None)
+        return getattr(process_handler, 'proc', process_handler)
+
+    def cached_appinfo(self):
+        """Returns the application info cached for the build of the runner,
+        or an empty dict."""
+        binary = getattr(self.runner, 'binary', None)
+        if not binary:
+            return {}
+        return cache.get_appinfo(binary, self.runner.profile.profile) or {}
+
+    def reset_profile(self):
+        """Replace the profile of the runner by a clean one."""
+        with self.trace('runner.reset'):
+            if self.profile_pool is None:
+                self.runner.reset()
+                return
+
+            profile = self.runner.profile
+            profile.cleanup()
+            self.runner.profile = self.profile_pool.profile(profile.__class__)
+
+    def create_pooled_runner(self, port):
+        """Returns a new runner like the current one for the application
+        pool, with a profile of the profile pool using the given port."""
+        runner = self.runner
+        profile = self.profile_pool.profile(runner.profile.__class__,
+                                            {'extensions.jsbridge.port': port})
+
+        # the runners must not share the arguments or the environment
+        return runner.__class__(profile=profile,
+                                binary=runner.binary,
+                                cmdargs=list(runner.cmdargs),
+                                env=dict(runner.env),
+                                kp_kwargs=dict(runner.kp_kwargs))
+
+    def switch_application(self):
+        """Replace the application by one of the application pool."""
+
+        runner, port, back_channel, bridge = self.application_pool.get()
+
+        # the previous application has already been stopped
+        if self.back_channel:
+            self.back_channel.close()
+            self.bridge.close()
+        self.runner.cleanup()
+
+        self.runner = runner
+        self.jsbridge_port = port
+        self.attach_network(back_channel, bridge)
+
     ### methods for shutting down and cleanup
 
-    def report_disconnect(self, message=None):
+    def report_disconnect(self, message=None, **details):
+        """Report the running test as failed by a disconnect.
+
+        Keyword arguments are added to the exception of the failure, e.g.
+        the exit code of a crashed application.
+
+        """
         message = message or 'Disconnect Error: Application unexpectedly closed'
 
         test = getattr(self, "current_test", {})
         test['passes'] = []
         test['fails'] = [{
-          'exception': {
-            'message': message
-          }
+          'exception': dict(details, message=message)
         }]
         test['passed'] = 0
         test['failed'] = 1
 
         # Ensure that we log this disconnect as failure
-        self.results.alltests.append(test)
-        self.results.fails.append(test)
+        self.fire_event('disconnect', test)
 
     def stop_runner(self, timeout=10):
-        # Give a second for any callbacks to finish.
-        sleep(1)
+        with self.trace('stop_runner'):
+            self._stop_runner(timeout)
 
+    def _stop_runner(self, timeout):
         # reset the shutdown mode
         self.shutdownMode = {}
 
-        # quit the application via JS
-        # this *will* cause a disconnect error
+        # quit the application via JS, which sends a drained event after
+        # all other events, so we know when all callbacks have finished
+        # this may cause a disconnect error
         # (not sure what the socket.error is all about)
+        deadline = time() + timeout
+        self.drained.clear()
         try:
-            mozmill = jsbridge.JSObject(self.bridge, js_module_mozmill)
-            mozmill.cleanQuit()
+            self.bridge.execFunction(js_module_mozmill + '.cleanQuit', [])
         except (socket.error, JSBridgeDisconnectError):
             pass
+        else:
+            self.drained.wait(max(deadline - time(), 0))
 
-        # wait for the runner to stop
-        self.runner.wait(timeout=timeout)
+        # wait for the runner to stop within the time left, but not without
+        # any limit as a timeout of 0 would
+        self.runner.wait(timeout=max(deadline - time(), SHUTDOWN_MIN_WAIT))
         if self.runner.is_running():
             raise Exception('client process shutdown unsuccessful')
 
     def stop(self):
         """Cleanup and invoking of final handlers."""
 
-        # ensure you have the application info for the case
-        # of no tests: https://bugzilla.mozilla.org/show_bug.cgi?id=751866
-        # this involves starting and stopping the browser
-        if self.results.appinfo is None:
-            self.start_runner()
-            self.stop_runner()
+        # for the case of no tests take the application info from the
+        # cache, if the same build has been run before; the application
+        # isn't started just for it:
+        # https://bugzilla.mozilla.org/show_bug.cgi?id=751866
+        if not self.results.appinfo and self.runner is not None:
+            self.results.appinfo = self.cached_appinfo()
 
         # close the bridge and back channel
         if self.back_channel:
@@ -491,27 +1010,193 @@ class MozMill(object):
         # cleanup
         if self.runner is not None:
             self.runner.cleanup()
+        if self.application_pool is not None:
+            self.application_pool.close()
+            self.application_pool = None
+        if self.profile_pool is not None:
+            self.profile_pool.close()
+            self.profile_pool = None
+
+
+class ShardForwarder(object):
+    """Event handler which forwards the events of a shard to its parent."""
+
+    # events which have to be handled in the process running the application
+    local_events = ('mozmill.drained', 'mozmill.firePythonCallback',
+                    'mozmill.setTestFile')
+
+    def __init__(self, queue, subscriptions=None):
+        self.queue = queue
+        self._subscriptions = subscriptions
+
+    def subscriptions(self):
+        # the events needed by the handlers of the parent
+        return self._subscriptions
+
+    def __call__(self, event, obj):
+        if event in self.local_events:
+            return
+
+        running_test = getattr(self.mozmill, 'running_test', None)
+        self.queue.put(('event', event, obj, running_test))
+
+
+def run_shard(queue, tests, restart, create_args, subscriptions=None):
+    """Run a shard of tests in its own MozMill instance.
+
+    All events are forwarded through the queue. A final ('done', appinfo,
+    error) message is sent when the shard has been finished.
+
+    Arguments:
+    queue -- multiprocessing.Queue to send the events to
+    tests -- Tests (array) which have to be executed
+    restart -- If True the application will be restarted between each test
+    create_args -- Keyword arguments for MozMill.create
+
+    Keyword arguments:
+    subscriptions -- Event types the parent has listeners for
+                     (None for all)
+
+    """
+    mozmill = None
+    error = None
+    try:
+        mozmill = MozMill.create(handlers=[python_callbacks.PythonCallbacks(),
+                                           ShardForwarder(queue,
+                                                          subscriptions)],
+                                 **create_args)
+        mozmill.run(tests, restart)
+    except:
+        error = traceback.format_exc()
+
+    appinfo = mozmill and mozmill.results.appinfo or {}
+    queue.put(('done', appinfo, error))
+
+
+class ShardError(Exception):
+    """Exception raised when one or more shards failed."""
+
+
+class ShardedMozMill(MozMill):
+    """MozMill test runner executing tests across several shards.
+
+    Each shard runs in its own process with its own runner, profile,
+    jsbridge port and MozMill instance. The events of all shards are
+    streamed back and dispatched to the handlers of this instance, so the
+    results end up in a single TestResults.
+
+    You should use ShardedMozMill as follows:
+
+        m = ShardedMozMill(4, create_args={'app': 'firefox', ...})
+        results = m.run(tests)
+        results.finish()
+    """
+
+    def __init__(self, jobs, create_args=None, results=None, handlers=(),
+                 durations=None):
+        """Constructor of the ShardedMozMill class.
+
+        Arguments:
+        jobs -- Number of shards to run in parallel
+
+        Keyword arguments:
+        create_args -- Keyword arguments for MozMill.create in each shard
+        results -- A TestResults instance to accumulate results
+        handlers -- pluggable event handlers
+        durations -- mapping of test file paths to their expected duration
+
+        """
+        MozMill.__init__(self, None, None, results=results,
+                         handlers=handlers)
+        self.jobs = jobs
+        self.create_args = create_args or {}
+        self.durations = durations
+
+    def persistDelta_listener(self, obj):
+        # each shard has its own versions of the persisted data, so the
+        # changes of all shards are merged
+        self.apply_persisted_delta(obj)
+
+    def shard(self, tests):
+        """Split the tests into one list of about equal duration per shard."""
+        import history
+        return history.partition(tests, self.jobs, self.durations)
+
+    def run(self, tests, restart=False):
+        """Run all the tests.
+
+        Arguments:
+        tests -- Tests (array) which have to be executed
+
+        Keyword Arguments:
+        restart -- If True the application will be restarted between each test
+
+        """
+        # only needed for parallel runs
+        import multiprocessing
+
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_shard,
+                                             args=(queue, shard, restart,
+                                                   self.create_args,
+                                                   self.subscriptions()))
+                     for shard in self.shard(list(tests)) if shard]
+        for process in processes:
+            process.start()
+
+        errors = []
+        try:
+            running = len(processes)
+            while running:
+                try:
+                    message = queue.get(timeout=1)
+                except Queue.Empty:
+                    if not [p for p in processes if p.is_alive()]:
+                        errors.append('%d shard(s) exited unexpectedly' %
+                                      running)
+                        break
+                    continue
+
+                if message[0] == 'event':
+                    event, obj, self.running_test = message[1:]
+                    self.dispatch_event(event, obj)
+                elif message[0] == 'done':
+                    appinfo, error = message[1:]
+                    if appinfo and not self.results.appinfo:
+                        self.results.appinfo = appinfo
+                    if error:
+                        errors.append(error)
+                    running -= 1
+        finally:
+            self.running_test = None
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+        if errors:
+            raise ShardError('\n'.join(errors))
+
+        return self.results
 
 
 ### method for test collection
 
-def collect_tests(path):
-    """Find all tests for a given path."""
+def collect_tests(path, use_cache=False):
+    """Find all tests for a given path.
+
+    Keyword arguments:
+    use_cache -- Reuse the tests found by a previous call, as long as the
+                 directories haven't been modified since
+
+    """
 
     path = os.path.realpath(path)
     if os.path.isfile(path):
         return [path]
 
     assert os.path.isdir(path), "Not a valid test file or directory: %s" % path
-    files = []
-    for filename in sorted(os.listdir(path)):
-        if filename.startswith("test"):
-            full = os.path.join(path, filename)
-            if os.path.isdir(full):
-                files += collect_tests(full)
-            else:
-                files.append(full)
-    return files
+    return cache.discover(path, use_cache)
 
 
 ### command line interface
@@ -529,7 +1214,8 @@ class CLI(mozrunner.CLI):
             name = getattr(handler_class, 'name', handler_class.__name__)
             self.handlers[name] = handler_class
 
-        self.jsbridge_port = jsbridge.find_port()
+        # looked up when the profile is created
+        self.jsbridge_port = None
 
         # add and parse options
         mozrunner.CLI.__init__(self, args)
@@ -541,8 +1227,11 @@ class CLI(mozrunner.CLI):
                                self.parser.get_option('-m')))
 
         # read tests from manifests (if any)
-        self.manifest = TestManifest(manifests=self.options.manifests,
-                                     strict=False)
+        manifest_class = TestManifest
+        if not self.options.no_cache:
+            manifest_class = cache.CachedTestManifest
+        self.manifest = manifest_class(manifests=self.options.manifests or (),
+                                       strict=False)
 
         # expand user directory and check existence for the test
         for test in self.options.tests:
@@ -552,12 +1241,14 @@ class CLI(mozrunner.CLI):
                 raise Exception("Not a valid test file/directory: %s" % test)
 
             # collect the tests
-            def testname(t):
-                if os.path.isdir(realpath):
-                    return os.path.join(test, os.path.relpath(t, testpath))
-                return test
-            tests = [{'name': testname(t), 'path': t}
-                     for t in collect_tests(testpath)]
+            if os.path.isdir(realpath):
+                tests = [{'name': os.path.join(test,
+                                               os.path.relpath(t, testpath)),
+                          'path': t}
+                         for t in collect_tests(realpath,
+                                                not self.options.no_cache)]
+            else:
+                tests = [{'name': test, 'path': realpath}]
             self.manifest.tests.extend(tests)
 
         # list the tests and exit if specified
@@ -585,12 +1276,38 @@ class CLI(mozrunner.CLI):
             if _handler is not None:
                 self.event_handlers.append(_handler)
 
+        # record test file durations
+        self.history = None
+        if self.options.history:
+            import history
+            build = None
+            if self.options.binary:
+                build = cache.build_identity(self.options.binary)
+            self.history = history.TestHistory(self.options.history, build)
+            self.event_handlers.append(self.history)
+        # record a timeline of the run, which is written after all other
+        # handlers have been stopped
+        self.tracer = None
+        if self.options.trace:
+            self.tracer = tracing.Tracer(self.options.trace)
+            self.event_handlers.append(self.tracer)
+
+        # the shards don't record the harness phases
+        if self.options.trace and self.options.jobs > 1:
+            self.parser.error("--trace can't be combined with --jobs")
+
+        if self.options.changed_only and not (self.history and
+                                              self.history.build):
+            self.parser.error("--changed-only requires --history and "
+                              "--binary")
+
         # if in manual mode, ensure we're interactive
         if self.options.manual:
             self.options.interactive = True
 
     def add_options(self, parser):
         """Add command line options."""
+        import history
 
         group = OptionGroup(parser, 'MozRunner options')
         mozrunner.CLI.add_options(self, group)
@@ -608,6 +1325,13 @@ class CLI(mozrunner.CLI):
                          default=JSBRIDGE_TIMEOUT,
                          help="Seconds before harness timeout if no "
                               "communication is taking place")
+        group.add_option("--hang-timeout",
+                         dest="hang_timeout",
+                         type="float",
+                         default=0,
+                         metavar="SECONDS",
+                         help="Kill the application if a test makes no "
+                              "progress for this long (default: disabled)")
         group.add_option("--restart",
                          dest='restart',
                          action='store_true',
@@ -629,6 +1353,10 @@ class CLI(mozrunner.CLI):
                          action='store_true',
                          default=False,
                          help="List test files that would be run, in order")
+        group.add_option('--no-cache', dest='no_cache',
+                         action='store_true', default=False,
+                         help="Don't use the caches of previous runs to "
+                              "find and parse the tests")
         group.add_option('--handler',
                          dest='handlers',
                          action='append',
@@ -647,6 +1375,46 @@ class CLI(mozrunner.CLI):
         group.add_option('--manual', dest='manual',
                          action='store_true', default=False,
                          help="start the browser without running any tests")
+        group.add_option('-j', '--jobs', dest='jobs',
+                         type='int', default=1, metavar='N',
+                         help="Run the tests in N parallel shards, each with "
+                              "its own application instance and profile")
+        group.add_option('--history', dest='history',
+                         metavar='PATH',
+                         help="Record the duration of each test file in the "
+                              "history database at PATH")
+        group.add_option('--schedule', dest='schedule',
+                         type='choice', choices=history.POLICIES,
+                         default='manifest',
+                         metavar='[%s]' % '|'.join(history.POLICIES),
+                         help="Order of the tests based on the history: "
+                              "manifest order, slowest or last failed "
+                              "first (default: %default)")
+        group.add_option('--trace', dest='trace',
+                         metavar='FILE',
+                         help="Write a timeline of the harness phases, "
+                              "bridge round trips and tests to FILE in the "
+                              "Chrome trace format (not with --jobs)")
+        group.add_option('--changed-only', dest='changed_only',
+                         action='store_true', default=False,
+                         help="Skip test files which passed with the same "
+                              "build and whose inputs haven't changed since, "
+                              "and report them as cached passes")
+        group.add_option('--results-journal', dest='results_journal',
+                         metavar='PATH',
+                         help="Store the results in the journal at PATH "
+                              "instead of keeping them in memory")
+        group.add_option('--profile-pool', dest='profile_pool',
+                         type='int', default=0, metavar='K',
+                         help="With --restart, keep K clean profiles cloned "
+                              "in the background for the next test files "
+                              "(0 disables the pool, default: %default)")
+        group.add_option('--app-pool', dest='application_pool',
+                         type='int', default=0, metavar='N',
+                         help="With --restart, start N application instances "
+                              "ahead of the test files using them. They run "
+                              "in the background and may take the focus "
+                              "(default: %default)")
 
         parser.add_option_group(group)
 
@@ -669,6 +1437,9 @@ class CLI(mozrunner.CLI):
         profile_args = mozrunner.CLI.profile_args(self)
         profile_args.setdefault('addons', []).extend(ADDONS)
 
+        if self.jsbridge_port is None:
+            self.jsbridge_port = jsbridge.find_port()
+
         profile_args['preferences'] = {
             'extensions.jsbridge.port': self.jsbridge_port
         }
@@ -697,14 +1468,57 @@ class CLI(mozrunner.CLI):
         if (not self.manifest.tests) and (not self.options.manual):
             self.parser.error("No tests found. Please specify with -t or -m")
 
-        # create a Mozrunner
-        runner = self.create_runner()
-
-        # create an instance of MozMill
-        mozmill = MozMill(runner, self.jsbridge_port,
-                          jsbridge_timeout=self.options.timeout,
-                          handlers=self.event_handlers,
-                          )
+        import history
+        import mozinfo
+
+        # order the tests
+        tests = history.schedule(self.manifest.active_tests(**mozinfo.info),
+                                 self.options.schedule, self.history)
+
+        # skip test files which passed with the same inputs before
+        if self.options.changed_only:
+            for test in tests:
+                if 'disabled' not in test and self.history.unchanged(test):
+                    test['cached'] = True
+
+        results = TestResults(self.options.results_journal)
+
+        if self.options.jobs > 1 and not self.options.manual:
+            # each shard creates its own runner from these arguments
+            runner_args = self.runner_args()
+            profile_args = runner_args.pop('profile_args')
+            if profile_args.get('profile'):
+                self.parser.error("A profile can't be shared between jobs")
+
+            mozmill = ShardedMozMill(self.options.jobs, results=results,
+                                     create_args={
+                                         'app': self.options.app,
+                                         'profile_args': profile_args,
+                                         'runner_args': runner_args,
+                                         'jsbridge_timeout':
+                                             self.options.timeout,
+                                         'profile_pool':
+                                             self.options.profile_pool,
+                                         'application_pool':
+                                             self.options.application_pool,
+                                         'hang_timeout':
+                                             self.options.hang_timeout},
+                                     handlers=self.event_handlers,
+                                     durations=self.history and
+                                               self.history.durations())
+        else:
+            # create a Mozrunner
+            runner = self.create_runner()
+
+            # create an instance of MozMill
+            mozmill = MozMill(runner, self.jsbridge_port, results=results,
+                              jsbridge_timeout=self.options.timeout,
+                              handlers=self.event_handlers,
+                              profile_pool=self.options.profile_pool,
+                              application_pool=self.options.application_pool,
+                              tracer=self.tracer,
+                              hang_timeout=self.options.hang_timeout,
+                              )
 
         # set debugger arguments
         mozmill.set_debugger(*self.debugger_arguments())
@@ -721,7 +1535,6 @@ class CLI(mozrunner.CLI):
 
         # run the tests
         exception = None
-        tests = self.manifest.active_tests(**mozinfo.info)
         try:
             mozmill.run(tests, self.options.restart)
         except:
@@ -0,0 +1,315 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""On-disk caches to speed up the startup of mozmill."""
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import ConfigParser
+import cPickle
+import hashlib
+import os
+import re
+import tempfile
+
+from manifestparser import TestManifest
+
+# include sections of manifests
+INCLUDE = re.compile(r'^\s*\[include:(.+)\]\s*$', re.M)
+
+# scandir knows the type of directory entries without calling stat
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def cache_dir():
+    """Returns the directory of the cache files.
+
+    The directory defaults to mozmill in the user's cache directory and
+    can be set with the MOZMILL_CACHE_DIR environment variable. An empty
+    value disables the caches, in which case None is returned.
+
+    """
+    path = os.environ.get('MOZMILL_CACHE_DIR')
+    if path is None:
+        base = (os.environ.get('XDG_CACHE_HOME') or
+                os.path.join(os.path.expanduser('~'), '.cache'))
+        path = os.path.join(base, 'mozmill')
+    return path or None
+
+
+def load(name):
+    """Returns the data of the named cache, or None if it is not available."""
+    directory = cache_dir()
+    if not directory:
+        return None
+
+    try:
+        f = file(os.path.join(directory, name), 'rb')
+        try:
+            return cPickle.load(f)
+        finally:
+            f.close()
+    except Exception:
+        # a missing or corrupt cache is simply rebuilt
+        return None
+
+
+def store(name, data):
+    """Write the data of the named cache.
+
+    The file is replaced atomically, so concurrent instances never read a
+    partially written cache. Failures to write are ignored.
+
+    """
+    directory = cache_dir()
+    if not directory:
+        return
+
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, path = tempfile.mkstemp(dir=directory, prefix=name)
+        f = os.fdopen(fd, 'wb')
+        try:
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(path, os.path.join(directory, name))
+    except (IOError, OSError):
+        pass
+
+
+def build_identity(binary):
+    """Returns a string identifying the build of the application binary.
+
+    The identity consists of the path, size and modification time of the
+    binary and the BuildID from its application.ini file.
+
+    """
+    stat = os.stat(binary)
+    identity = [os.path.abspath(binary), stat.st_size, stat.st_mtime]
+
+    # application.ini lives next to the binary or in the Resources folder
+    # of a Mac application bundle
+    directory = os.path.dirname(binary)
+    for path in (os.path.join(directory, 'application.ini'),
+                 os.path.join(directory, '..', 'Resources', 'application.ini'),
+                 os.path.join(binary, 'Contents', 'MacOS', 'application.ini'),
+                 os.path.join(binary, 'Contents', 'Resources',
+                              'application.ini')):
+        if os.path.isfile(path):
+            config = ConfigParser.RawConfigParser()
+            config.read(path)
+            if config.has_option('App', 'BuildID'):
+                identity.append(config.get('App', 'BuildID'))
+            break
+
+    return json.dumps(identity)
+
+
+def get_appinfo(binary, profile):
+    """Returns the cached application info of a build, or None.
+
+    The info is only valid for the same build (see `build_identity`) and
+    the same add-ons installed in the profile.
+
+    """
+    try:
+        key = appinfo_key(binary, profile)
+    except OSError:
+        return None
+
+    cached = (load('appinfo') or {}).get(os.path.abspath(binary))
+    if cached and cached[0] == key:
+        return dict(cached[1])
+    return None
+
+
+def set_appinfo(binary, profile, appinfo):
+    """Cache the application info of a build.
+
+    The startup info is specific to each start of the application, so it
+    isn't cached but has to be fetched from the running application.
+
+    """
+    try:
+        key = appinfo_key(binary, profile)
+    except OSError:
+        return
+
+    appinfo = dict(appinfo)
+    appinfo.pop('startupinfo', None)
+
+    # only the most recent build of each binary is kept
+    cache = load('appinfo') or {}
+    cache[os.path.abspath(binary)] = (key, appinfo)
+    store('appinfo', cache)
+
+
+def appinfo_key(binary, profile):
+    extensions = os.path.join(profile, 'extensions')
+    addons = os.path.isdir(extensions) and sorted(os.listdir(extensions)) or []
+    return build_identity(binary), addons
+
+
+def scan(path, prefix=''):
+    """Returns the sorted (name, is directory) pairs of the entries of a
+    directory whose names start with the prefix."""
+    if scandir is not None:
+        return sorted([(entry.name, entry.is_dir())
+                       for entry in scandir(path)
+                       if entry.name.startswith(prefix)])
+
+    return [(name, os.path.isdir(os.path.join(path, name)))
+            for name in sorted(os.listdir(path))
+            if name.startswith(prefix)]
+
+
+def walk_tests(path):
+    """Returns the test files below a directory and the modification times
+    of the directories visited to find them.
+
+    Only files and directories whose names start with "test" are taken
+    into account. Like the directory itself, directories below it are
+    resolved to their real paths.
+
+    """
+    files = []
+    mtimes = {}
+
+    def walk(directory):
+        mtimes[directory] = os.stat(directory).st_mtime
+        for name, is_dir in scan(directory, 'test'):
+            fullpath = os.path.join(directory, name)
+            if is_dir:
+                walk(os.path.realpath(fullpath))
+            else:
+                files.append(fullpath)
+
+    walk(path)
+    return files, mtimes
+
+
+def discover(path, use_cache=True):
+    """Returns the test files below a directory.
+
+    With the cache the result of a previous run is used, as long as none
+    of the directories it visited has been modified since.
+
+    """
+    cache = use_cache and load('discovery') or {}
+    if path in cache:
+        files, mtimes = cache[path]
+        try:
+            for directory, mtime in mtimes.items():
+                if os.stat(directory).st_mtime != mtime:
+                    break
+            else:
+                return list(files)
+        except OSError:
+            pass
+
+    files, mtimes = walk_tests(path)
+    if use_cache:
+        cache[path] = (files, mtimes)
+        store('discovery', cache)
+    return files
+
+
+def manifest_files(path, files=None):
+    """Returns the manifest and the manifests it includes, recursively."""
+    files = files if files is not None else []
+    path = os.path.abspath(path)
+    if path in files or not os.path.isfile(path):
+        return files
+    files.append(path)
+
+    f = file(path)
+    try:
+        content = f.read()
+    finally:
+        f.close()
+
+    for include in INCLUDE.findall(content):
+        manifest_files(os.path.join(os.path.dirname(path), include.strip()),
+                       files)
+    return files
+
+
+class CachedTestManifest(TestManifest):
+    """TestManifest which caches the parsed tests and the active tests.
+
+    The cache is valid as long as none of the manifest files, including
+    the ones pulled in with [include:] sections, has been modified. Active
+    tests are cached for each combination of the values they are filtered
+    by (e.g. mozinfo).
+
+    """
+
+    def __init__(self, manifests=(), **kwargs):
+        self.cache = None
+        if not manifests:
+            TestManifest.__init__(self, **kwargs)
+            return
+
+        paths = [os.path.abspath(manifest) for manifest in manifests]
+        self.cache_name = ('manifest-' +
+                           hashlib.sha1(repr(paths)).hexdigest())
+        cached = load(self.cache_name)
+
+        if cached and self.unchanged(cached['mtimes']):
+            TestManifest.__init__(self, **kwargs)
+            self.rootdir = cached['rootdir']
+            self.tests.extend([dict(test) for test in cached['tests']])
+            self.cache = cached
+            return
+
+        # the manifests are checked before parsing them, so changes while
+        # they get parsed invalidate the cache
+        mtimes = {}
+        for path in paths:
+            for manifest in manifest_files(path):
+                mtimes[manifest] = os.stat(manifest).st_mtime
+
+        TestManifest.__init__(self, manifests=manifests, **kwargs)
+        self.cache = {'mtimes': mtimes,
+                      'rootdir': getattr(self, 'rootdir', None),
+                      'tests': [dict(test) for test in self.tests],
+                      'active': {}}
+        store(self.cache_name, self.cache)
+
+    def unchanged(self, mtimes):
+        try:
+            for path, mtime in mtimes.items():
+                if os.stat(path).st_mtime != mtime:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def active_tests(self, exists=True, disabled=True, **tags):
+        # tests added or changed after parsing aren't covered by the cache
+        if self.cache is None or self.tests != self.cache['tests']:
+            return TestManifest.active_tests(self, exists, disabled, **tags)
+
+        # test files may be removed without touching the manifests, so
+        # whether they exist is checked on each call
+        key = repr((disabled, sorted(tags.items())))
+        if key not in self.cache['active']:
+            self.cache['active'][key] = [
+                dict(test) for test in
+                TestManifest.active_tests(self, False, disabled, **tags)]
+            store(self.cache_name, self.cache)
+        return [dict(test) for test in self.cache['active'][key]
+                if not exists or os.path.exists(test['path'])]
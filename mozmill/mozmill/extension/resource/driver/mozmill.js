@@ -152,7 +152,23 @@ function getApplicationDetails() {
   return JSON.stringify(details);
 }
 
+// the startup info of the running application, for application details
+// known from a previous start
+function getStartupDetails() {
+  return JSON.stringify(getStartupInfo());
+}
+
 function cleanQuit () {
+  // Events are written to the back channel as soon as they get fired, so
+  // the drained marker tells python that no more events will follow
+  try {
+    var jsbridge = {};
+    Cu.import('resource://jsbridge/modules/Events.jsm', jsbridge);
+    jsbridge.Events.fireEvent('mozmill.drained', {});
+  } catch (e) {
+    // no back channel available to acknowledge the shutdown
+  }
+
   // Cause a quit to happen. We need the timeout in order to allow
   // jsbridge enough time to signal back to python before the shutdown starts
   // TODO: for some reason observers on shutdown don't work here?
@@ -3,8 +3,9 @@
  * file, You can obtain one at http://mozilla.org/MPL/2.0/. */
 
 var EXPORTED_SYMBOLS = ['loadFile','Collector','Runner','events', 
-                        'jsbridge', 'runTestFile', 'log', 'getThread',
-                        'timers', 'persisted'];
+                        'jsbridge', 'runTestFile', 'runTestFiles', 'log',
+                        'getThread', 'timers', 'persisted', 'setPersisted',
+                        'setSubscriptions'];
 
 const Cc = Components.classes;
 const Ci = Components.interfaces;
@@ -12,6 +13,9 @@ const Cu = Components.utils;
 
 const TIMEOUT_SHUTDOWN_HTTPD = 15000;
 
+// milliseconds between the summaries of events not sent to python
+const DROPPED_EVENTS_INTERVAL = 1000;
+
 
 Cu.import('resource://mozmill/stdlib/httpd.js');
 
@@ -31,10 +35,27 @@ var uuidgen = Cc["@mozilla.org/uuid-generator;1"].getService(Ci.nsIUUIDGenerator
 
 var persisted = {};
 
+// version of the persisted data known to python, and the serialized
+// values of its properties, which changes are detected against
+var persistedVersion = 0;
+var persistedValues = {};
+
+// event types python has listeners for (null for all of them), and the
+// number of events by type which haven't been sent because of that since
+// the last summary
+var subscriptions = null;
+var droppedEvents = {};
+var droppedEventsCount = 0;
+var droppedEventsSent = 0;
+
 var mozmill = undefined;
 var mozelement = undefined;
 var modules = undefined;
 
+// modules required by each loaded module, since a module loaded before
+// doesn't require its own modules again
+var requiredModules = {};
+
 var moduleLoader = new securableModule.Loader({
   rootPaths: ["resource://mozmill/modules/"],
   defaultPrincipal: "system",
@@ -51,6 +72,19 @@ var arrayRemove = function (array, from, to) {
   return array.push.apply(array, rest);
 };
 
+var moduleFiles = function (spec, files) {
+  // collect a module and all the modules it requires, directly or not
+  files = files || {};
+  if (!(spec in files)) {
+    files[spec] = true;
+    (requiredModules[spec] || []).forEach(function (required) {
+      moduleFiles(required, files);
+    });
+  }
+
+  return files;
+}
+
 var loadTestResources = function () {
   // load resources we want in our tests
   if (mozmill == undefined) {
@@ -107,9 +141,39 @@ var loadFile = function (path, collector) {
       loader.modules = modules;
     }
 
+    // record the modules required by modules, which are resolved relative
+    // to the requiring one
+    var fs = loader.fs;
+    var resolveModule = fs.resolveModule;
+    var resolved = null;
+    fs.resolveModule = function (base, name) {
+      var spec = resolveModule.call(fs, base, name);
+      if (spec && base) {
+        var required = requiredModules[base] = requiredModules[base] || [];
+        if (required.indexOf(spec) == -1) {
+          required.push(spec);
+        }
+      } else if (spec) {
+        resolved = spec;
+      }
+
+      return spec;
+    }
+
     var retval = loader.require(mod);
     modules = loader.modules;
 
+    // report the local files of the module and the modules it requires
+    if (resolved) {
+      for (var spec in moduleFiles(resolved)) {
+        var uri = ios.newURI(spec, null, null);
+        if (uri instanceof Ci.nsIFileURL) {
+          events.fireEvent('fileDependency', {'filename': path,
+                                              'path': uri.file.path});
+        }
+      }
+    }
+
     return retval;
   }
 
@@ -244,7 +308,8 @@ events.endTest = function (test) {
              'fails' : test.__fails__,
              'name'  : test.__name__,
              'time_start': test.__start__,
-             'time_end': test.__end__}
+             'time_end': test.__end__,
+             'duration': test.__end__ - test.__start__}
 
   if (test.skipped) {
     obj['skipped'] = true;
@@ -380,7 +445,34 @@ events.removeListener = function (listener) {
 
 events.persist = function () {
   try {
-    events.fireEvent('persist', persisted);
+    var values = {};
+    var changed = {};
+    var deleted = [];
+    var modified = false;
+
+    for (var key in persisted) {
+      values[key] = JSON.stringify(persisted[key]);
+      if (values[key] !== persistedValues[key]) {
+        changed[key] = persisted[key];
+        modified = true;
+      }
+    }
+    for (var key in persistedValues) {
+      if (!(key in values)) {
+        deleted.push(key);
+        modified = true;
+      }
+    }
+
+    // only the changes since the last version are sent
+    if (modified) {
+      events.fireEvent('persistDelta', {'base': persistedVersion,
+                                        'version': persistedVersion + 1,
+                                        'changed': changed,
+                                        'deleted': deleted});
+      persistedVersion += 1;
+      persistedValues = values;
+    }
   } catch (e) {
     events.fireEvent('error', "persist serialization failed.")
   }
@@ -423,12 +515,35 @@ try {
   Cu.import('resource://jsbridge/modules/Events.jsm');
 
   events.addListener('', function (name, obj) {
-    Events.fireEvent('mozmill.' + name, obj);
+    var type = 'mozmill.' + name;
+
+    if (subscriptions && !(type in subscriptions)) {
+      droppedEvents[type] = (droppedEvents[type] || 0) + 1;
+      droppedEventsCount++;
+
+      // regular summaries also keep the bridge from timing out while a
+      // test only fires events nobody listens to
+      if (Date.now() - droppedEventsSent >= DROPPED_EVENTS_INTERVAL) {
+        sendDroppedEvents();
+      }
+      return;
+    }
+
+    Events.fireEvent(type, obj);
   });
 } catch (e) {
   aConsoleService.logStringMessage("Event module of JSBridge not available.");
 }
 
+var sendDroppedEvents = function () {
+  if (droppedEventsCount) {
+    Events.fireEvent('mozmill.droppedEvents', droppedEvents);
+    droppedEvents = {};
+    droppedEventsCount = 0;
+  }
+  droppedEventsSent = Date.now();
+}
+
 function Collector () {
   // the collector handles HTTPD and initilizing the module
   this.test_modules_by_filename = {};
@@ -436,6 +551,7 @@ function Collector () {
   this.httpd_started = false;
   this.http_port = 43336;
   this.httpd = null;
+  this.http_resources = [];
 }
 
 Collector.prototype.getServer = function (port, basePath) {
@@ -497,10 +613,24 @@ Collector.prototype.addHttpResource = function (directory, ns) {
   var lp = Cc["@mozilla.org/file/local;1"].createInstance(Ci.nsILocalFile);
   lp.initWithPath(os.abspath(directory, this.current_file));
   this.httpd.registerDirectory(ns, lp);
+  this.http_resources.push(ns);
+
+  events.fireEvent('fileDependency', {'filename': this.current_path,
+                                      'directory': lp.path});
 
   return 'http://localhost:' + this.http_port + ns
 }
 
+Collector.prototype.resetHttpResources = function () {
+  // unregister the directories of the previous test file but keep the
+  // server running for the next one
+  for each (var ns in this.http_resources) {
+    this.httpd.registerDirectory(ns, null);
+  }
+
+  this.http_resources = [];
+}
+
 Collector.prototype.initTestModule = function (filename, testname) {
   var test_module = loadFile(filename, this);
   var has_restarted = !(testname == null);
@@ -587,8 +717,27 @@ Runner.prototype.runTestFile = function (filename, name) {
   this.runTestModule(this.collector.test_modules_by_filename[filename]);
 }
 
+Runner.prototype.runTestFiles = function (filenames) {
+  for (var i = 0; i < filenames.length; i++) {
+    if (i > 0) {
+      // test files only share the server, not its directories
+      this.collector.resetHttpResources();
+      events.persist();
+    }
+
+    events.fireEvent('setTestFile', {'filename': filenames[i], 'index': i});
+    this.runTestFile(filenames[i]);
+
+    // the remaining files have to be run after the restart
+    if (events.userShutdown || events.appQuit) {
+      break;
+    }
+  }
+}
+
 Runner.prototype.end = function () {
   events.persist();
+  sendDroppedEvents();
   this.collector.stopHttpd();
   events.fireEvent('endRunner', true);
 }
@@ -738,6 +887,39 @@ var runTestFile = function (filename, invokedFromIDE, name) {
   return true;
 }
 
+var runTestFiles = function (filenames, invokedFromIDE) {
+  var runner = new Runner(new Collector(), invokedFromIDE);
+  runner.runTestFiles(filenames);
+  runner.end();
+
+  return true;
+}
+
+// replace the persisted data by the one of python in a single call
+var setPersisted = function (data, version) {
+  persisted = data;
+  persistedVersion = version;
+  persistedValues = {};
+  for (var key in data) {
+    persistedValues[key] = JSON.stringify(data[key]);
+  }
+
+  return true;
+}
+
+// only send the events of the given types to python (null for all)
+var setSubscriptions = function (types) {
+  subscriptions = null;
+  if (types) {
+    subscriptions = {};
+    for (var i = 0; i < types.length; i++) {
+      subscriptions[types[i]] = true;
+    }
+  }
+
+  return true;
+}
+
 var getThread = function () {
   return thread;
 }
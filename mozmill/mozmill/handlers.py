@@ -9,6 +9,9 @@ pluggable event handlers for mozmill
 import imp
 import inspect
 import os
+import sys
+
+import cache
 
 
 class EventHandler(object):
@@ -33,6 +36,18 @@ class EventHandler(object):
         """
         return {}
 
+    def subscriptions(self):
+        """Retrieve the event types handled by `__call__`.
+
+        Returns a list of event types, or None if all events are needed.
+        Only the events some handler needs are sent by the application.
+
+        """
+        # handlers overriding __call__ get all events unless they say so
+        if type(self).__call__.im_func is EventHandler.__call__.im_func:
+            return []
+        return None
+
     def stop(self, results, fatal):
         """Handles harness shutdown (NOT a JS event)."""
 
@@ -102,13 +117,40 @@ def load_handler(string):
     return handler
 
 
-def handlers():
+def entry_points(refresh=False):
+    """Returns the (name, module, attributes) of the handler entry points.
+
+    Scanning the installed distributions with pkg_resources is slow, so
+    the entry points are cached as long as the directories in sys.path
+    haven't been modified.
+
+    """
+    key = [(path, os.stat(path).st_mtime)
+           for path in sys.path if os.path.exists(path)]
+
+    cached = not refresh and cache.load('entry_points')
+    if cached and cached[0] == key:
+        return cached[1]
+
     from pkg_resources import iter_entry_points
+    entries = [(i.name, i.module_name, i.attrs)
+               for i in iter_entry_points('mozmill.event_handlers')]
+    cache.store('entry_points', (key, entries))
+    return entries
+
+
+def handlers():
     handlers = []
-    for i in iter_entry_points('mozmill.event_handlers'):
-        try:
-            handlers.append(i.load())
-        except:
-            # TODO : error handling
-            raise
+    try:
+        for name, module_name, attrs in entry_points():
+            handler = __import__(module_name, fromlist=['__name__'])
+            for attr in attrs:
+                handler = getattr(handler, attr)
+            handlers.append(handler)
+    except (ImportError, AttributeError):
+        # the cache is outdated, e.g. a handler has been uninstalled
+        from pkg_resources import iter_entry_points
+        handlers = [i.load()
+                    for i in iter_entry_points('mozmill.event_handlers')]
+        entry_points(refresh=True)
     return handlers
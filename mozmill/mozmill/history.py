@@ -0,0 +1,237 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Timing history of test files and scheduling based on it."""
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import hashlib
+import heapq
+import os
+import time
+
+
+# policies to order the tests of a run
+POLICIES = ('manifest', 'slowest', 'failures')
+
+# weight of the most recent duration in the recorded average
+DURATION_WEIGHT = 0.5
+
+
+class TestHistory(object):
+    """Event handler recording the duration and outcome of test files.
+
+    The history is stored in a SQLite database, keyed by the path of the
+    test file. It is updated from the `mozmill.endTestFile` events and
+    committed when the run has been finished.
+
+    If the build of the application is known, the fingerprints of passing
+    test files and their dependencies are recorded too, so unchanged files
+    can be skipped by later runs.
+
+    """
+    name = 'History'
+
+    def __init__(self, path, build=None):
+        self.path = path
+        self.build = build
+
+        # files the running test files depend on, by test file path
+        self.dependencies = {}
+
+        # sqlite3 is only imported by runs keeping a history
+        import sqlite3
+
+        # events are dispatched from the jsbridge network thread
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS files (
+                             path TEXT PRIMARY KEY,
+                             runs INTEGER,
+                             duration REAL,
+                             failed INTEGER,
+                             last_run REAL)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS fingerprints (
+                             path TEXT PRIMARY KEY,
+                             fingerprint TEXT,
+                             dependencies TEXT)""")
+
+    def events(self):
+        return {'mozmill.endTestFile': self.endTestFile,
+                'mozmill.fileDependency': self.fileDependency}
+
+    def stop(self, results, fatal):
+        self.db.commit()
+        self.db.close()
+
+    ### event listeners
+
+    def endTestFile(self, obj):
+        row = self.db.execute("SELECT runs, duration FROM files "
+                              "WHERE path = ?", (obj['path'],)).fetchone()
+        duration = obj['duration']
+        runs = 1
+        if row:
+            runs += row[0]
+            duration = (DURATION_WEIGHT * duration +
+                        (1 - DURATION_WEIGHT) * row[1])
+
+        self.db.execute("INSERT OR REPLACE INTO files "
+                        "(path, runs, duration, failed, last_run) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (obj['path'], runs, duration,
+                         int(obj['failed'] > 0), time.time()))
+
+        # only files which passed as expected can be skipped later on
+        dependencies = self.dependencies.pop(obj['path'], set())
+        test = getattr(getattr(self, 'mozmill', None), 'running_test', None)
+        if (self.build is None or obj['failed'] or not test or
+            test.get('expected') == 'fail'):
+            self.db.execute("DELETE FROM fingerprints WHERE path = ?",
+                            (obj['path'],))
+        else:
+            self.db.execute("INSERT OR REPLACE INTO fingerprints "
+                            "(path, fingerprint, dependencies) "
+                            "VALUES (?, ?, ?)",
+                            (obj['path'],
+                             fingerprint(test, dependencies, self.build),
+                             json.dumps(sorted(dependencies))))
+
+    def fileDependency(self, obj):
+        # either the file of a module or a directory served by the test
+        # server
+        path = obj.get('path') or obj['directory']
+        self.dependencies.setdefault(obj['filename'], set()).add(path)
+
+    ### queries
+
+    def durations(self):
+        """Returns a mapping of test file paths to their average duration
+        in milliseconds."""
+        return dict(self.db.execute("SELECT path, duration FROM files"))
+
+    def unchanged(self, test):
+        """Returns whether the test file and its dependencies are unchanged
+        since it passed with the same build of the application."""
+        if self.build is None:
+            return False
+
+        row = self.db.execute("SELECT fingerprint, dependencies "
+                              "FROM fingerprints WHERE path = ?",
+                              (test['path'],)).fetchone()
+        return bool(row) and row[0] == fingerprint(test, json.loads(row[1]),
+                                                   self.build)
+
+    def failures(self):
+        """Returns the paths of test files which failed in their last run."""
+        return set([row[0] for row in
+                    self.db.execute("SELECT path FROM files "
+                                    "WHERE failed = 1")])
+
+
+def fingerprint(test, dependencies, build):
+    """Returns a hash of the inputs of a test file.
+
+    Arguments:
+    test -- Manifest entry of the test file
+    dependencies -- Paths of the files and directories it depends on
+    build -- Identity of the application build
+
+    """
+    entry = sorted([(key, value) for key, value in test.items()
+                    if key != 'cached'])
+    digest = hashlib.sha1(json.dumps([build, entry]))
+
+    for path in [test['path']] + sorted(dependencies):
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        digest.update(path)
+        if os.path.isdir(path):
+            # resources served by the test server are covered by their
+            # size and modification time
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for filename in sorted(files):
+                    stat = os.stat(os.path.join(root, filename))
+                    digest.update('%s %d %d' % (
+                            os.path.relpath(os.path.join(root, filename),
+                                            path),
+                            stat.st_size, stat.st_mtime))
+        elif os.path.isfile(path):
+            f = file(path, 'rb')
+            try:
+                digest.update(f.read())
+            finally:
+                f.close()
+        else:
+            digest.update('missing')
+
+    return digest.hexdigest()
+
+
+def estimate(tests, durations):
+    """Returns the expected duration for each of the tests.
+
+    Tests without a recorded duration are expected to take as long as the
+    median of the known durations.
+
+    """
+    known = sorted(durations.values())
+    default = known and known[len(known) // 2] or 1.
+    return [durations.get(test['path'], default) for test in tests]
+
+
+def schedule(tests, policy, history=None):
+    """Order the tests according to the scheduling policy.
+
+    Arguments:
+    tests -- Tests (array) in manifest order
+    policy -- One of POLICIES
+
+    Keyword arguments:
+    history -- TestHistory instance to base the order on
+
+    """
+    tests = list(tests)
+    if history is None or policy == 'manifest':
+        return tests
+
+    if policy == 'slowest':
+        expected = estimate(tests, history.durations())
+        order = sorted(range(len(tests)), key=lambda i: -expected[i])
+        return [tests[i] for i in order]
+
+    if policy == 'failures':
+        failures = history.failures()
+        return sorted(tests, key=lambda test: test['path'] not in failures)
+
+    raise ValueError("Unknown scheduling policy: %s" % policy)
+
+
+def partition(tests, count, durations=None):
+    """Split the tests into shards of about equal duration.
+
+    Tests are assigned longest first, each to the shard with the smallest
+    expected duration so far. Within a shard the tests keep their order.
+
+    Arguments:
+    tests -- Tests (array) to split
+    count -- Number of shards
+
+    Keyword arguments:
+    durations -- mapping of test file paths to their duration
+
+    """
+    expected = estimate(tests, durations or {})
+    shards = [(0., i, []) for i in range(count)]
+
+    for index in sorted(range(len(tests)), key=lambda i: -expected[i]):
+        load, i, shard = heapq.heappop(shards)
+        shard.append(index)
+        heapq.heappush(shards, (load + expected[index], i, shard))
+
+    return [[tests[index] for index in sorted(shard)]
+            for load, i, shard in sorted(shards, key=lambda shard: shard[1])]
@@ -0,0 +1,100 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""On-disk journal of test results for runs too large to keep in memory."""
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import os
+
+from array import array
+from threading import Lock
+
+
+class Journal(object):
+    """Append-only file with one JSON encoded record per line.
+
+    Records are referenced by their offset in the file, so they can be
+    read back in any order while the journal is still being written.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = file(path, 'w+b')
+        self.lock = Lock()
+
+    def write(self, record):
+        """Append a record and return its offset."""
+        self.lock.acquire()
+        try:
+            self.file.seek(0, os.SEEK_END)
+            offset = self.file.tell()
+            self.file.write(json.dumps(record) + '\n')
+            return offset
+        finally:
+            self.lock.release()
+
+    def read(self, offset):
+        """Returns the record at the given offset."""
+        self.lock.acquire()
+        try:
+            self.file.seek(offset)
+            line = self.file.readline()
+        finally:
+            self.lock.release()
+        return json.loads(line)
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            self.file.flush()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.file.close()
+        finally:
+            self.lock.release()
+
+
+class Records(object):
+    """Sequence of records stored in a journal.
+
+    Only the offsets are kept in memory. Records are decoded when they are
+    accessed, so iterating over a sequence reads them one at a time.
+
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+
+        # unsigned longs only have 32 bits on Windows, doubles hold the
+        # offsets of journals larger than 4 GiB exactly
+        self.offsets = array('d')
+
+    def append(self, record):
+        self.add(self.journal.write(record))
+
+    def add(self, offset):
+        """Add a record which is already stored in the journal."""
+        self.offsets.append(offset)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield self.journal.read(int(offset))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.journal.read(int(offset))
+                    for offset in self.offsets[index]]
+        return self.journal.read(int(self.offsets[index]))
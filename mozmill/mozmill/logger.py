@@ -127,45 +127,75 @@ class LoggerListener(object):
                           help="Format for logging (default: %default)")
 
     def __call__(self, event, obj):
-        string = json.dumps(obj)
-        if self.format in ["pprint", "pprint-color"]:
-            string = self.pprint(obj)
-
+        level = logging.DEBUG
         if event == 'mozmill.pass':
-            self.logger.debug('Step Pass: ' + string)
+            prefix = 'Step Pass: '
         elif event == 'mozmill.fail':
-            self.logger.debug('Test Failure | ' + string)
+            prefix = 'Test Failure | '
         elif event == 'mozmill.frameworkFail':
-            self.logger.fatal('Framework Failure | ' + string)
+            level = logging.CRITICAL
+            prefix = 'Framework Failure | '
         elif event == 'mozmill.skip':
-            self.logger.debug('Test Skipped: ' + string)
+            prefix = 'Test Skipped: '
         else:
-            self.logger.debug(str(event) + ' | ' + string)
+            prefix = str(event) + ' | '
+
+        # don't format events none of the handlers would log
+        if not self.is_logged(level):
+            return
+
+        if self.format in ["pprint", "pprint-color"]:
+            string = self.pprint(obj)
+        else:
+            string = json.dumps(obj)
+        self.logger.log(level, prefix + string)
+
+    def is_logged(self, level):
+        """Returns whether a message of the level would be written by any
+        handler, with the levels of the loggers and handlers at the time of
+        the call."""
+        if not self.logger.isEnabledFor(level):
+            return False
+
+        logger = self.logger
+        while logger:
+            for handler in logger.handlers:
+                if level >= handler.level:
+                    return True
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        return False
 
     def pprint(self, obj):
-        self.find_stack(obj)
-        return json.dumps(obj, indent=2)
+        return json.dumps(self.find_stack(obj), indent=2)
 
     def find_stack(self, obj):
-        """Split any stacktrace string into an array."""
-        if type(obj) == dict or type(obj) == list:
-            iter = obj
-            if type(obj) == list:
-                iter = range(len(obj))
-
-            for i in iter:
-                child = obj[i]
-                if i == "stack":
+        """Returns a copy of the object with any stacktrace string split
+        into an array.
+
+        The object itself is shared with other listeners, so it is left
+        unchanged.
+
+        """
+        if type(obj) == dict:
+            copy = {}
+            for key, child in obj.items():
+                if key == "stack":
                     if isinstance(child, basestring):
                         # It is not very pythonic, but we need to do something
                         # completely different if our stack is a string and
                         # not an object. It's much more readable to simply
                         # have two separate functions
-                        obj[i] = self.clean_stack_as_string(child)
+                        copy[key] = self.clean_stack_as_string(child)
                     else:
-                        obj[i] = self.clean_stack(child)
+                        copy[key] = self.clean_stack(child)
                 else:
-                    self.find_stack(child)
+                    copy[key] = self.find_stack(child)
+            return copy
+        elif type(obj) == list:
+            return [self.find_stack(child) for child in obj]
+        return obj
 
     def clean_stack(self, caller):
         try:
@@ -212,6 +242,12 @@ class LoggerListener(object):
         return {'mozmill.setTest': self.startTest,
                 'mozmill.endTest': self.endTest}
 
+    def subscriptions(self):
+        # apart from framework failures, events are logged at debug level
+        if self.is_logged(logging.DEBUG):
+            return None
+        return ['mozmill.frameworkFail']
+
     def stop(self, results, fatal):
         """Print pass/failed/skipped statistics."""
 
@@ -0,0 +1,340 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Pools of clean profiles and started applications for restarts between
+test files."""
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import atexit
+import hashlib
+import os
+import Queue
+import re
+import shutil
+import sys
+import tempfile
+
+import jsbridge
+
+from threading import Lock, Thread
+
+
+# seconds to wait for an application of the pool, which includes starting
+# it and connecting to its jsbridge server
+START_TIMEOUT = 2 * jsbridge.wait_to_create_timeout
+
+# templates by fingerprint of their content
+templates = {}
+templates_lock = Lock()
+
+
+def fingerprint(path, ignore=()):
+    """Returns a hash of the content of a profile.
+
+    Arguments:
+    path -- Path of the profile
+
+    Keyword arguments:
+    ignore -- names of preferences in user.js which don't count
+
+    """
+    ignored = [re.compile(r'^user_pref\(%s,' % re.escape(json.dumps(name)))
+               for name in ignore]
+    digest = hashlib.sha1()
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            fullpath = os.path.join(root, filename)
+            digest.update(os.path.relpath(fullpath, path))
+
+            f = file(fullpath, 'rb')
+            try:
+                for line in f:
+                    if not [regex for regex in ignored if regex.match(line)]:
+                        digest.update(line)
+            finally:
+                f.close()
+
+    return digest.hexdigest()
+
+
+def clone(source, destination):
+    """Copy a profile.
+
+    Files of installed add-ons are never modified by the application, so
+    they are hard linked where possible instead of being copied.
+
+    """
+    for root, dirs, files in os.walk(source):
+        relpath = os.path.relpath(root, source)
+        target = os.path.normpath(os.path.join(destination, relpath))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+
+        link = (relpath.split(os.sep)[0] == 'extensions' and
+                hasattr(os, 'link'))
+        for filename in files:
+            if link:
+                try:
+                    os.link(os.path.join(root, filename),
+                            os.path.join(target, filename))
+                    continue
+                except OSError:
+                    link = False
+            shutil.copy2(os.path.join(root, filename),
+                         os.path.join(target, filename))
+
+
+def set_preferences(profile, preferences):
+    """Append preferences to the user.js file of a profile.
+
+    Preferences which are set later override the earlier ones.
+
+    """
+    f = file(os.path.join(profile, 'user.js'), 'a')
+    try:
+        for name, value in preferences.items():
+            f.write('user_pref(%s, %s);\n' % (json.dumps(name),
+                                              json.dumps(value)))
+    finally:
+        f.close()
+
+
+def get_template(profile, ignore=()):
+    """Returns the path of a template with the content of the profile.
+
+    Templates are shared by all profiles with the same add-ons and
+    preferences, apart from the ignored preferences.
+
+    """
+    key = fingerprint(profile, ignore)
+
+    templates_lock.acquire()
+    try:
+        if key not in templates:
+            template = tempfile.mkdtemp(suffix='.mozmill-template')
+            clone(profile, template)
+            templates[key] = template
+        return templates[key]
+    finally:
+        templates_lock.release()
+
+
+def remove_templates():
+    for template in templates.values():
+        shutil.rmtree(template, ignore_errors=True)
+    templates.clear()
+
+atexit.register(remove_templates)
+
+
+class ProfilePool(object):
+    """Pool of clean profiles cloned from a template.
+
+    Clones are made in the background, so the next `size` profiles are
+    ready by the time they are needed.
+
+    """
+
+    def __init__(self, profile, size=2, preferences=None):
+        """Constructor of the ProfilePool class.
+
+        Arguments:
+        profile -- Path of a clean profile to base the template on
+
+        Keyword arguments:
+        size -- Number of profiles to keep ready
+        preferences -- Preferences to set in each clone, which may differ
+                       from the ones in the template
+
+        """
+        self.preferences = preferences or {}
+        self.template = get_template(profile, self.preferences.keys())
+        self.ready = Queue.Queue()
+        self.workers = []
+        self.closed = False
+
+        for i in range(size):
+            self.prepare()
+
+    def clone(self):
+        """Clone the template into a new profile."""
+        path = tempfile.mkdtemp(suffix='.mozrunner')
+        clone(self.template, path)
+
+        if self.preferences:
+            set_preferences(path, self.preferences)
+
+        return path
+
+    def prepare(self):
+        """Clone a profile in the background."""
+        def worker():
+            path = self.clone()
+            if self.closed:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                self.ready.put(path)
+
+        thread = Thread(target=worker)
+        thread.setDaemon(True)
+        thread.start()
+
+        self.workers = [t for t in self.workers if t.isAlive()] + [thread]
+
+    def get(self, preferences=None):
+        """Returns the path of a clean profile.
+
+        The caller is responsible for removing the profile once done.
+
+        Keyword arguments:
+        preferences -- Preferences to set in this profile only
+
+        """
+        try:
+            path = self.ready.get_nowait()
+        except Queue.Empty:
+            path = self.clone()
+
+        self.prepare()
+
+        if preferences:
+            set_preferences(path, preferences)
+        return path
+
+    def profile(self, profile_class, preferences=None):
+        """Returns a clean instance of the given mozprofile class."""
+        profile = profile_class(profile=self.get(preferences), restore=False)
+
+        # the profile is a copy, so it has to be removed on cleanup
+        profile.create_new = True
+        return profile
+
+    def close(self):
+        """Stop cloning and remove all profiles which haven't been used."""
+        self.closed = True
+        for worker in self.workers:
+            worker.join()
+
+        while True:
+            try:
+                shutil.rmtree(self.ready.get_nowait(), ignore_errors=True)
+            except Queue.Empty:
+                break
+
+
+class ApplicationPool(object):
+    """Pool of applications started ahead of the test files using them.
+
+    Each application runs with its own jsbridge port and a profile from
+    the profile pool. It is started and connected in the background while
+    the current test file is still running.
+
+    """
+
+    def __init__(self, create_runner, size=1, timeout=START_TIMEOUT):
+        """Constructor of the ApplicationPool class.
+
+        Arguments:
+        create_runner -- Callable returning a new MozRunner instance with a
+                         profile of its own for the given jsbridge port
+
+        Keyword arguments:
+        size -- Number of applications to keep started
+        timeout -- Seconds to wait for an application in `get`
+
+        """
+        self.create_runner = create_runner
+        self.timeout = timeout
+        self.ready = Queue.Queue()
+        self.workers = []
+        self.closed = False
+
+        for i in range(size):
+            self.prepare()
+
+    def start(self):
+        """Start an application and connect to its jsbridge server.
+
+        Returns a tuple of the runner, the jsbridge port, the back channel
+        and the bridge.
+
+        """
+        port = jsbridge.find_port()
+        runner = self.create_runner(port)
+
+        try:
+            runner.start()
+            back_channel, bridge = jsbridge.wait_and_create_network(
+                '127.0.0.1', port)
+        except:
+            runner.cleanup()
+            raise
+
+        return runner, port, back_channel, bridge
+
+    def prepare(self):
+        """Start an application in the background."""
+        def worker():
+            try:
+                self.ready.put((self.start(), None))
+            except:
+                self.ready.put((None, sys.exc_info()))
+
+            if self.closed:
+                self.discard()
+
+        thread = Thread(target=worker)
+        thread.setDaemon(True)
+        thread.start()
+
+        self.workers = [t for t in self.workers if t.isAlive()] + [thread]
+
+    def get(self):
+        """Returns the next started application.
+
+        See `start` for the returned values. The caller is responsible for
+        stopping the application once done.
+
+        """
+        if self.closed:
+            raise Exception('The application pool has been closed')
+
+        try:
+            application, error = self.ready.get(timeout=self.timeout)
+        except Queue.Empty:
+            raise Exception('No application of the pool started within %s '
+                            'seconds' % self.timeout)
+        self.prepare()
+
+        if error:
+            raise error[0], error[1], error[2]
+        return application
+
+    def discard(self):
+        """Stop all applications which haven't been used."""
+        while True:
+            try:
+                application, error = self.ready.get_nowait()
+            except Queue.Empty:
+                break
+
+            if application:
+                runner, port, back_channel, bridge = application
+                back_channel.close()
+                bridge.close()
+                runner.cleanup()
+
+    def close(self):
+        """Stop starting and stop all applications which haven't been used."""
+        self.closed = True
+        for worker in self.workers:
+            worker.join()
+
+        self.discard()
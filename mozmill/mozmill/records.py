@@ -0,0 +1,110 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compact records of test results."""
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import zlib
+
+
+# fields stored as attributes, all others are kept in the compressed details
+FIELDS = ('filename', 'name', 'passed', 'failed', 'skipped')
+
+# strings shared between records
+strings = {}
+
+
+def intern_string(value):
+    """Returns a shared copy of the string, which other records may use too.
+
+    Values which are not strings are returned unchanged.
+
+    """
+    if not isinstance(value, basestring):
+        return value
+    return strings.setdefault(value, value)
+
+
+class TestRecord(object):
+    """Read-mostly, dict like record of a test result.
+
+    File and test names are interned, and everything apart from the
+    summary fields (the passes and fails with their stacks, meta data, ...)
+    is stored as a compressed blob, which is only decoded on access.
+
+    """
+    __slots__ = FIELDS + ('_details',)
+
+    def __init__(self, test):
+        test = dict(test)
+        for field in FIELDS:
+            setattr(self, field, intern_string(test.pop(field, None)))
+
+        self._details = None
+        if test:
+            self._details = zlib.compress(json.dumps(test))
+
+    @property
+    def details(self):
+        if self._details is None:
+            return {}
+        return json.loads(zlib.decompress(self._details))
+
+    def to_dict(self):
+        """Returns the record as dictionary."""
+        test = self.details
+        for field in FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                test[field] = value
+        return test
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.details[key]
+
+    def __setitem__(self, key, value):
+        if key in FIELDS:
+            setattr(self, key, intern_string(value))
+        else:
+            details = self.details
+            details[key] = value
+            self._details = zlib.compress(json.dumps(details))
+
+    def __contains__(self, key):
+        return self.get(key) is not None or key in self.details
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, TestRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'TestRecord(%r)' % self.to_dict()
@@ -2,7 +2,6 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import mozinfo
 import platform
 import sys
 import urllib2
@@ -16,6 +15,48 @@ except:
 from handlers import HandlerMatchException
 
 
+def default(obj):
+    """Encode the types of results which json doesn't know about."""
+    # results are only encoded once a report is written
+    from journal import Records
+    from records import TestRecord
+
+    if isinstance(obj, TestRecord):
+        return obj.to_dict()
+    if isinstance(obj, Records):
+        return list(obj)
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+
+def iterencode(obj):
+    """Encode an object as JSON in chunks.
+
+    Results stored in a journal are read and encoded one at a time, so
+    the report never has to be held in memory as a whole.
+
+    """
+    from journal import Records
+
+    if isinstance(obj, dict):
+        yield '{'
+        for index, (key, value) in enumerate(obj.items()):
+            if index:
+                yield ', '
+            yield json.dumps(key) + ': '
+            for chunk in iterencode(value):
+                yield chunk
+        yield '}'
+    elif isinstance(obj, Records):
+        yield '['
+        for index, record in enumerate(obj):
+            if index:
+                yield ', '
+            yield json.dumps(record, default=default)
+        yield ']'
+    else:
+        yield json.dumps(obj, default=default)
+
+
 class Report(object):
     def __init__(self, report, date_format="%Y-%m-%dT%H:%M:%SZ"):
         if not isinstance(report, basestring):
@@ -53,12 +94,15 @@ class Report(object):
                   'tests_failed': len(results.fails),
                   'tests_skipped': len(results.skipped),
                   'results': results.alltests,
+                  'test_files': results.testfiles,
+                  'dropped_events': results.dropped_events,
                   'screenshots': results.screenshots,
                   }
 
         if results.appinfo:
             report.update(results.appinfo)
 
+        import mozinfo
         report['system_info'] = {"bits": str(mozinfo.bits),
                                  "hostname": platform.node(),
                                  "processor": mozinfo.processor,
@@ -85,7 +129,9 @@ class Report(object):
                 print "Printing results to '%s' failed (%s)." % (filename, e)
                 return
         if f:
-            print >> f, json.dumps(results)
+            for chunk in iterencode(results):
+                f.write(chunk)
+            f.write('\n')
             return
 
         # report to CouchDB
@@ -96,7 +142,7 @@ class Report(object):
 
             # Send a POST request to the DB.
             # The POST is implied by the body data
-            body = json.dumps(results)
+            body = ''.join(iterencode(results))
             request = urllib2.Request(report_url, body,
                                       {"Content-Type": "application/json"})
 
@@ -0,0 +1,120 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Timeline of the harness phases in the Chrome trace event format.
+
+The written file can be loaded in chrome://tracing or Perfetto.
+"""
+
+try:
+    import json
+except:
+    import simplejson as json
+
+import os
+
+from threading import Lock, currentThread
+from time import time
+
+
+# thread id of the spans of the JS tests
+JS_THREAD = 0
+
+
+class NullSpan(object):
+    """Span which doesn't record anything, used while not tracing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+null_span = NullSpan()
+
+
+class Span(object):
+    """Context manager recording the time spent in its block."""
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        args = self.args
+        if exc_type is not None:
+            args = dict(args, exception=exc_type.__name__)
+        self.tracer.add(self.name, self.category, self.start, time(), args)
+        return False
+
+
+class Tracer(object):
+    """Event handler recording timed spans of the harness and the tests.
+
+    Harness phases are recorded with `span`, bridge round trips through
+    `round_trip`, and the test functions from their endTest events. The
+    trace is written when the run has been finished.
+
+    """
+    name = 'Trace'
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.trace_events = [{'name': 'thread_name', 'ph': 'M',
+                              'pid': self.pid, 'tid': JS_THREAD,
+                              'args': {'name': 'JS tests'}}]
+
+    def events(self):
+        return {'mozmill.endTest': self.endTest}
+
+    def stop(self, results, fatal):
+        f = file(self.path, 'w')
+        try:
+            json.dump({'traceEvents': self.trace_events,
+                       'displayTimeUnit': 'ms'}, f)
+        finally:
+            f.close()
+
+    def add(self, name, category, start, end, args=None, tid=None):
+        """Add a complete event (times in seconds since the epoch)."""
+        if tid is None:
+            tid = currentThread().ident
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                 'pid': self.pid, 'tid': tid}
+        if args:
+            event['args'] = args
+
+        self.lock.acquire()
+        try:
+            self.trace_events.append(event)
+        finally:
+            self.lock.release()
+
+    def span(self, name, category='harness', **args):
+        """Returns a context manager recording the time spent in its block."""
+        return Span(self, name, category, args)
+
+    def round_trip(self, command, start, end):
+        """Record a round trip of the bridge."""
+        self.add('bridge', 'jsbridge', start, end, {'command': command[:80]})
+
+    ### event listeners
+
+    def endTest(self, test):
+        if 'time_start' not in test:
+            return
+
+        # timestamps of the JS side are in milliseconds
+        self.add(test['name'], 'test', test['time_start'] / 1000.,
+                 test['time_end'] / 1000., {'filename': test['filename']},
+                 tid=JS_THREAD)
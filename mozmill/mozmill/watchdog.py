@@ -0,0 +1,154 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Watchdog for tests which stopped making progress."""
+
+import os
+
+from collections import deque
+from threading import Event, Lock, Thread
+from time import time
+
+
+# number of events kept for the diagnostics of a hang
+HISTORY = 20
+
+
+def cpu_time(pid):
+    """Returns the CPU time in seconds a process has used so far, or None
+    if it is not available (e.g. on systems without /proc)."""
+    try:
+        f = file('/proc/%d/stat' % pid)
+        try:
+            stat = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return None
+
+    # the fields following the command name, which may contain spaces,
+    # start with the state; user and system time come 11 fields later
+    fields = stat[stat.rindex(')') + 2:].split()
+    ticks = int(fields[11]) + int(fields[12])
+    return ticks / float(os.sysconf('SC_CLK_TCK'))
+
+
+class Watchdog(object):
+    """Thread killing the application when a test stopped making progress.
+
+    Events of the back channel and round trips of the bridge count as
+    progress. Once the running test went without progress for longer than
+    the budget, the diagnostics of the hang are stored as `hang` and the
+    application gets killed, so pending bridge calls fail and the run can
+    continue with the next test.
+
+    """
+
+    def __init__(self, mozmill, budget, interval=1.):
+        """Constructor of the Watchdog class.
+
+        Arguments:
+        mozmill -- MozMill instance running the tests
+        budget -- Seconds a test may go without progress
+
+        Keyword arguments:
+        interval -- Seconds between two checks for progress
+
+        """
+        self.mozmill = mozmill
+        self.budget = budget
+        self.interval = interval
+
+        self.events = deque(maxlen=HISTORY)
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+        # diagnostics of the last hang
+        self.hang = None
+
+        self.progress(None)
+
+    def __call__(self, event, obj):
+        self.lock.acquire()
+        try:
+            self.events.append({'time': time(), 'event': event})
+        finally:
+            self.lock.release()
+
+    def subscriptions(self):
+        # every event of the application counts as progress
+        return None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stopped.isSet():
+            self.stopped.wait(self.interval)
+            self.check()
+
+    def progress(self, process):
+        self.last_progress = time()
+        self.last_traffic = self.mozmill.traffic()
+        self.last_cpu_time = process and cpu_time(process.pid)
+
+    def check(self):
+        """Kill the application if the running test made no progress."""
+        mozmill = self.mozmill
+        process = mozmill.application_process()
+
+        # only tests of a watched application can hang
+        if (mozmill.running_test is None or mozmill.shutdownMode or
+            not mozmill.watch_process or process is None or
+            process.poll() is not None or
+            mozmill.traffic() != self.last_traffic):
+            self.progress(process)
+            return
+
+        idle = time() - self.last_progress
+        if idle < self.budget:
+            return
+
+        self.hang = self.diagnostics(process, idle)
+        try:
+            process.kill()
+        except OSError:
+            # the application exited in the meantime
+            pass
+        self.progress(None)
+
+    def diagnostics(self, process, idle):
+        """Returns the information about a hang of the application."""
+        test = getattr(self.mozmill, 'current_test', None) or {}
+
+        self.lock.acquire()
+        try:
+            events = list(self.events)
+        finally:
+            self.lock.release()
+
+        diagnostics = {'budget': self.budget,
+                       'idle': idle,
+                       'pid': process.pid,
+                       'test': {'filename': test.get('filename'),
+                                'name': test.get('name')},
+                       'events': events,
+                       'cpu_time': cpu_time(process.pid)}
+
+        # spent computing or waiting since the last progress
+        if (diagnostics['cpu_time'] is not None and
+            self.last_cpu_time is not None):
+            diagnostics['cpu_time_idle'] = (diagnostics['cpu_time'] -
+                                            self.last_cpu_time)
+        return diagnostics
@@ -44,7 +44,8 @@ setup(name=PACKAGE_NAME,
       install_requires=['jsbridge == 3.0rc1',
                         'mozrunner == 5.10',
                         'ManifestDestiny == 0.5.5',
-                        'mozinfo == 0.3.3'],
+                        'mozinfo == 0.3.3',
+                        'scandir == 1.10.0'],
       classifiers=[license, topic,
                    'Development Status :: 4 - Beta',
                    'Environment :: Console',
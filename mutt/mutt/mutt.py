@@ -11,7 +11,7 @@ import sys
 import traceback
 import unittest
 
-from manifestparser import TestManifest
+from mozmill.cache import CachedTestManifest
 from mozmill.logger import LoggerListener
 
 
@@ -251,7 +251,7 @@ def run(arguments=sys.argv[1:]):
     os.environ['BROWSER_PATH'] = options.binary
 
     # Parse the manifest
-    mp = TestManifest(manifests=(options.manifest,), strict=False)
+    mp = CachedTestManifest(manifests=(options.manifest,), strict=False)
 
     # run + report
     if command == "testpy":
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozmill import cache
+
+
+class CacheTestCase(unittest.TestCase):
+    """base class using a temporary cache and tests directory"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.environ = os.environ.get('MOZMILL_CACHE_DIR')
+        os.environ['MOZMILL_CACHE_DIR'] = os.path.join(self.tempdir, 'cache')
+
+        self.tests = os.path.join(self.tempdir, 'tests')
+        os.makedirs(os.path.join(self.tests, 'testDir'))
+        for path in ('test1.js', 'head.js', 'testDir/test2.js'):
+            self.write(path)
+
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ['MOZMILL_CACHE_DIR']
+        else:
+            os.environ['MOZMILL_CACHE_DIR'] = self.environ
+        shutil.rmtree(self.tempdir)
+
+    def write(self, path, content=''):
+        path = os.path.join(self.tests, path)
+        f = file(path, 'w')
+        f.write(content)
+        f.close()
+        return path
+
+    def touch(self, path):
+        # make sure the modification time differs from the cached one
+        mtime = os.stat(path).st_mtime
+        os.utime(path, (mtime + 1, mtime + 1))
+
+
+class TestDiscoveryCache(CacheTestCase):
+    """test finding tests with the discovery cache"""
+
+    def test_discover(self):
+        expected = [os.path.join(self.tests, 'test1.js'),
+                    os.path.join(self.tests, 'testDir', 'test2.js')]
+        self.assertEqual(cache.discover(self.tests), expected)
+        self.assertEqual(cache.load('discovery')[self.tests][0], expected)
+        self.assertEqual(cache.discover(self.tests), expected)
+
+        # a new file modifies the directory and invalidates the cache
+        path = self.write('testDir/test3.js')
+        self.touch(os.path.dirname(path))
+        self.assertEqual(cache.discover(self.tests), expected + [path])
+
+    def test_symlinked_directory(self):
+        if not hasattr(os, 'symlink'):
+            return
+
+        # directories are resolved to their real paths
+        shared = os.path.join(self.tempdir, 'shared')
+        os.makedirs(shared)
+        file(os.path.join(shared, 'test3.js'), 'w').close()
+        os.symlink(shared, os.path.join(self.tests, 'testLinked'))
+
+        self.assertEqual(cache.discover(self.tests)[-1],
+                         os.path.join(os.path.realpath(shared), 'test3.js'))
+
+
+class TestManifestCache(CacheTestCase):
+    """test caching the tests of manifests"""
+
+    def names(self, manifest):
+        return [test['name'] for test in manifest.active_tests()]
+
+    def test_manifest(self):
+        manifest = self.write('manifest.ini',
+                              '[test1.js]\n[include:testDir/manifest.ini]\n')
+        included = self.write('testDir/manifest.ini', '[test2.js]\n')
+
+        self.assertEqual(self.names(cache.CachedTestManifest([manifest])),
+                         ['test1.js', 'test2.js'])
+
+        cached = cache.CachedTestManifest([manifest])
+        self.assertEqual(sorted(cached.cache['mtimes'].keys()),
+                         sorted([manifest, included]))
+        self.assertEqual(self.names(cached), ['test1.js', 'test2.js'])
+
+        # a modified include invalidates the cache
+        self.write('testDir/test3.js')
+        self.write('testDir/manifest.ini', '[test2.js]\n[test3.js]\n')
+        self.touch(included)
+        self.assertEqual(self.names(cache.CachedTestManifest([manifest])),
+                         ['test1.js', 'test2.js', 'test3.js'])
+
+    def test_removed_test(self):
+        manifest = self.write('manifest.ini',
+                              '[test1.js]\n[include:testDir/manifest.ini]\n')
+        self.write('testDir/manifest.ini', '[test2.js]\n')
+        self.assertEqual(self.names(cache.CachedTestManifest([manifest])),
+                         ['test1.js', 'test2.js'])
+
+        # the manifests still list the removed file
+        os.remove(os.path.join(self.tests, 'testDir', 'test2.js'))
+        cached = cache.CachedTestManifest([manifest])
+        self.assertEqual(self.names(cached), ['test1.js'])
+        self.assertEqual(len(cached.active_tests(exists=False)), 2)
+
+
+class TestAppinfoCache(CacheTestCase):
+    """test caching the application info of a build"""
+
+    def test_appinfo(self):
+        binary = self.write('firefox', 'binary')
+        self.write('application.ini', '[App]\nBuildID=20120101000000\n')
+        profile = os.path.join(self.tempdir, 'profile')
+        os.makedirs(os.path.join(profile, 'extensions', 'mozmill@mozilla.com'))
+
+        appinfo = {'application_name': 'Firefox', 'startupinfo': {'main': 1}}
+        self.assertEqual(cache.get_appinfo(binary, profile), None)
+        cache.set_appinfo(binary, profile, appinfo)
+        self.assertEqual(cache.get_appinfo(binary, profile),
+                         {'application_name': 'Firefox'})
+
+        # other add-ons invalidate the cache
+        os.makedirs(os.path.join(profile, 'extensions', 'addon@example.com'))
+        self.assertEqual(cache.get_appinfo(binary, profile), None)
+        cache.set_appinfo(binary, profile, appinfo)
+
+        # so does another build
+        self.write('application.ini', '[App]\nBuildID=20120102000000\n')
+        self.assertEqual(cache.get_appinfo(binary, profile), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import socket
+import unittest
+
+from time import time
+
+from jsbridge.network import Bridge, JSBridgeCrashError
+from jsbridge.network import JSBridgeDisconnectError
+
+
+class TestCrashDetection(unittest.TestCase):
+    """test failing bridge calls as soon as the application has exited"""
+
+    def setUp(self):
+        # a server which accepts the connection but never answers
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_exit_status(self):
+        bridge = Bridge('127.0.0.1', self.server.getsockname()[1],
+                        timeout=60.)
+        bridge.exit_status = lambda: -9
+        try:
+            started = time()
+            try:
+                bridge.execFunction('frame.runTestFile', [])
+                self.fail('JSBridgeCrashError not raised')
+            except JSBridgeCrashError, e:
+                self.assertEqual(e.exit_code, -9)
+                self.assertEqual(str(e), 'Application killed by signal 9')
+
+            # the bridge doesn't wait for its timeout
+            self.assertTrue(time() - started < 5)
+        finally:
+            bridge.close()
+
+    def test_clean_exit(self):
+        bridge = Bridge('127.0.0.1', self.server.getsockname()[1],
+                        timeout=60.)
+        bridge.exit_status = lambda: 0
+        try:
+            try:
+                bridge.execFunction('frame.runTestFile', [])
+                self.fail('JSBridgeDisconnectError not raised')
+            except JSBridgeDisconnectError, e:
+                self.assertFalse(isinstance(e, JSBridgeCrashError))
+                self.assertEqual(str(e), 'Application exited unexpectedly')
+        finally:
+            bridge.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,5 +22,47 @@ class ModuleEndTest(unittest.TestCase):
         self.assertEqual(len(results.fails), 0, "Fails should match")
         self.assertEqual(len(results.skipped), 0, "Skips should match")
 
+    def test_timing(self):
+        manifest = manifestparser.TestManifest(
+            manifests=[os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    "js-tests",
+                                    "restart_endtest",
+                                    "tests.ini")],
+            strict=False)
+
+        m = mozmill.MozMill.create()
+        results = m.run(manifest.active_tests())
+
+        for test in results.alltests:
+            self.assertEqual(test['duration'],
+                             test['time_end'] - test['time_start'])
+            for key in ('round_trips', 'bytes_sent', 'bytes_received'):
+                self.assertTrue(test[key] >= 0)
+
+        self.assertEqual(set([f['path'] for f in results.testfiles]),
+                         set([t['path'] for t in manifest.active_tests()]))
+        for testfile in results.testfiles:
+            self.assertTrue(testfile['time_start'] <= testfile['time_end'])
+            self.assertTrue(testfile['bytes_received'] > 0)
+
+        # test2.js restarts the application once to continue with a test
+        restarts = dict([(os.path.basename(testfile['path']),
+                          testfile['restarts'])
+                         for testfile in results.testfiles])
+        self.assertEqual(len(restarts['test2.js']), 1)
+
+    def test_repeated_file(self):
+        # a file listed twice in a batch is timed once for each entry
+        m = mozmill.MozMill(None, None)
+        m.batch = [{'path': 'test1.js'}, {'path': 'test1.js'}]
+        m.batch_index = 0
+        m.start_test_file(m.batch[0])
+
+        m.dispatch_event('mozmill.setTestFile', {'filename': 'test1.js',
+                                                 'index': 1})
+        self.assertEqual(m.batch_index, 1)
+        self.assertTrue(m.running_test is m.batch[1])
+        self.assertEqual(len(m.results.testfiles), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozmill import history
+
+
+class TestHistory(unittest.TestCase):
+    """test the timing history and the scheduling based on it"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.history = history.TestHistory(os.path.join(self.tempdir,
+                                                        'history.sqlite'))
+        self.tests = [{'path': path} for path in ('a.js', 'b.js', 'c.js')]
+
+        self.history.endTestFile({'path': 'a.js', 'duration': 1000.,
+                                  'failed': 0})
+        self.history.endTestFile({'path': 'b.js', 'duration': 10000.,
+                                  'failed': 0})
+        self.history.endTestFile({'path': 'c.js', 'duration': 5000.,
+                                  'failed': 1})
+
+    def tearDown(self):
+        self.history.stop(None, False)
+        shutil.rmtree(self.tempdir)
+
+    def paths(self, tests):
+        return [test['path'] for test in tests]
+
+    def test_durations(self):
+        self.history.endTestFile({'path': 'a.js', 'duration': 3000.,
+                                  'failed': 0})
+        self.assertEqual(self.history.durations(),
+                         {'a.js': 2000., 'b.js': 10000., 'c.js': 5000.})
+        self.assertEqual(self.history.failures(), set(['c.js']))
+
+    def test_schedule(self):
+        self.assertEqual(self.paths(history.schedule(self.tests, 'manifest',
+                                                     self.history)),
+                         ['a.js', 'b.js', 'c.js'])
+        self.assertEqual(self.paths(history.schedule(self.tests, 'slowest',
+                                                     self.history)),
+                         ['b.js', 'c.js', 'a.js'])
+        self.assertEqual(self.paths(history.schedule(self.tests, 'failures',
+                                                     self.history)),
+                         ['c.js', 'a.js', 'b.js'])
+
+    def test_partition(self):
+        tests = self.tests + [{'path': 'd.js'}]
+        shards = history.partition(tests, 2, self.history.durations())
+
+        # the unknown test d.js is expected to take the median of 5 seconds
+        self.assertEqual([self.paths(shard) for shard in shards],
+                         [['a.js', 'b.js'], ['c.js', 'd.js']])
+
+        # without a history the tests are spread evenly
+        shards = history.partition(tests, 2)
+        self.assertEqual([len(shard) for shard in shards], [2, 2])
+
+    def test_unchanged(self):
+        test = {'path': os.path.join(self.tempdir, 'test.js')}
+        module = os.path.join(self.tempdir, 'shared.js')
+        for path in (test['path'], module):
+            f = file(path, 'w')
+            f.write('// %s\n' % path)
+            f.close()
+
+        self.history.build = 'build'
+        self.history.mozmill = type('MozMill', (), {'running_test': test})
+        self.history.fileDependency({'filename': test['path'],
+                                     'path': module})
+        self.history.endTestFile({'path': test['path'], 'duration': 1000.,
+                                  'failed': 0})
+        self.assertTrue(self.history.unchanged(test))
+
+        # another build of the application
+        self.history.build = 'other build'
+        self.assertFalse(self.history.unchanged(test))
+        self.history.build = 'build'
+
+        # a changed dependency
+        f = file(module, 'a')
+        f.write('var changed = true;\n')
+        f.close()
+        self.assertFalse(self.history.unchanged(test))
+
+    def test_unicode_path(self):
+        test = {'path': os.path.join(self.tempdir, 'test.js')}
+        dependency = os.path.join(self.tempdir, u'modul\xe9.js')
+        self.assertEqual(history.fingerprint(test, [dependency], 'build'),
+                         history.fingerprint(test,
+                                             [dependency.encode('utf-8')],
+                                             'build'))
+
+
+if __name__ == '__main__':
+    unittest.main()
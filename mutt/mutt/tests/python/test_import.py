@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# modules only needed by some runs, which mustn't be imported up front
+LAZY_MODULES = ('multiprocessing', 'sqlite3', 'mozmill.history',
+                'mozmill.journal', 'mozmill.pool', 'mozmill.records',
+                'mozmill.watchdog')
+
+
+class TestImport(unittest.TestCase):
+    """test the modules needed to import mozmill and to set up its CLI"""
+
+    def make_test(self):
+        """make an example test to run"""
+        fd, path = tempfile.mkstemp(suffix='.js')
+        os.write(fd, "var test_something = function() {}")
+        os.close(fd)
+        return path
+
+    def run_code(self, code):
+        """Returns the `result` set by the given code and the names of the
+        modules it imported.
+
+        They are passed in a file, since event handlers like the logger
+        may take over the standard output.
+
+        """
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        code = ("result = None\n" + code +
+                "\nimport sys\n"
+                "modules = [name for name, module in sys.modules.items()\n"
+                "           if module is not None]\n"
+                "import json\n"
+                "json.dump([result, modules], file(%r, 'w'))\n" % path)
+        try:
+            subprocess.check_call([sys.executable, '-c', code])
+            f = file(path)
+            try:
+                return json.load(f)
+            finally:
+                f.close()
+        finally:
+            os.remove(path)
+
+    def assertNotImported(self, modules, lazy_modules=LAZY_MODULES):
+        for module in lazy_modules:
+            self.assertFalse(module in modules,
+                             "%s has been imported" % module)
+
+    def test_import(self):
+        result, modules = self.run_code("import mozmill")
+        self.assertNotImported(modules)
+
+    def test_cli(self):
+        path = self.make_test()
+        try:
+            code = ("import mozmill\n"
+                    "cli = mozmill.CLI(['-t', %r])\n"
+                    "result = cli.jsbridge_port\n" % path)
+            result, modules = self.run_code(code)
+        finally:
+            os.remove(path)
+
+        # no port is looked up before the application is started
+        self.assertEqual(result, None)
+
+        # the options list the scheduling policies of the history, which
+        # imports sqlite3 only once it is used
+        self.assertNotImported(modules, [module for module in LAZY_MODULES
+                                         if module != 'mozmill.history'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozmill import journal
+from mozmill.report import iterencode
+
+
+class TestJournal(unittest.TestCase):
+    """test storing results in a journal and reading them back"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.journal = journal.Journal(os.path.join(self.tempdir,
+                                                    'results.jsonl'))
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_records(self):
+        alltests = journal.Records(self.journal)
+        fails = journal.Records(self.journal)
+
+        alltests.append({'name': 'testPass', 'failed': 0})
+        offset = self.journal.write({'name': 'testFail', 'failed': 1})
+        alltests.add(offset)
+        fails.add(offset)
+
+        self.assertEqual(len(alltests), 2)
+        self.assertEqual(len(fails), 1)
+        self.assertEqual([test['name'] for test in alltests],
+                         ['testPass', 'testFail'])
+        self.assertEqual(fails[0]['name'], 'testFail')
+
+    def test_large_offsets(self):
+        # offsets beyond 4 GiB
+        records = journal.Records(self.journal)
+        records.add(5 << 30)
+        self.assertEqual(int(records.offsets[0]), 5 << 30)
+
+    def test_iterencode(self):
+        records = journal.Records(self.journal)
+        records.append({'name': 'testPass'})
+        records.append({'name': 'testSkip'})
+
+        report = {'results': records, 'tests_passed': 1}
+        self.assertEqual(json.loads(''.join(iterencode(report))),
+                         {'results': [{'name': 'testPass'},
+                                      {'name': 'testSkip'}],
+                          'tests_passed': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mozmill.logger import LoggerListener
+
+
+class TestLoggerListener(unittest.TestCase):
+    """test formatting events only for the enabled log levels"""
+
+    def setUp(self):
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+        self.logger = logging.getLogger('mozmill')
+        self.handlers = self.logger.handlers
+        self.logger.handlers = []
+
+        self.tempdir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tempdir, 'mozmill.log')
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        for handler in self.logger.handlers:
+            handler.close()
+        self.logger.handlers = self.handlers
+        shutil.rmtree(self.tempdir)
+
+    def read_log(self):
+        f = file(self.log_file)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_skip_debug(self):
+        listener = LoggerListener(log_file=self.log_file, console_level=None,
+                                  file_level='INFO')
+
+        # the object can't be serialized, so it must not be formatted
+        listener('mozmill.pass', {'function': object()})
+        listener('mozmill.frameworkFail', {'message': 'broken'})
+        self.assertFalse('Step Pass' in self.read_log())
+        self.assertTrue('Framework Failure' in self.read_log())
+
+    def test_level_change(self):
+        listener = LoggerListener(log_file=self.log_file, console_level=None,
+                                  file_level='INFO')
+
+        # levels changed after the listener has been created are respected
+        self.logger.handlers[0].setLevel(logging.DEBUG)
+        listener('mozmill.pass', {'function': 'test'})
+        self.assertTrue('Step Pass' in self.read_log())
+
+        self.logger.setLevel(logging.INFO)
+        listener('mozmill.skip', {'function': object()})
+        self.assertFalse('Test Skipped' in self.read_log())
+
+    def test_shared_object(self):
+        listener = LoggerListener(log_file=self.log_file, console_level=None,
+                                  file_level='DEBUG', format='pprint')
+
+        obj = {'fails': [{'exception': {'stack': 'a@b:1\nc@d:2'}}]}
+        listener('mozmill.fail', obj)
+        self.assertEqual(obj['fails'][0]['exception']['stack'], 'a@b:1\nc@d:2')
+        self.assertTrue('"a@b:1"' in self.read_log())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozmill import pool
+
+
+class TestProfilePool(unittest.TestCase):
+    """test cloning of profiles from a template"""
+
+    def setUp(self):
+        self.profile = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.profile, 'extensions', 'addon'))
+        self.write('extensions/addon/install.rdf', '<RDF/>\n')
+        self.write('user.js', 'user_pref("extensions.jsbridge.port", 24242);\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.profile)
+
+    def write(self, relpath, content):
+        f = file(os.path.join(self.profile, relpath), 'w')
+        f.write(content)
+        f.close()
+
+    def test_fingerprint(self):
+        fingerprint = pool.fingerprint(self.profile)
+        ignoring = pool.fingerprint(self.profile,
+                                    ['extensions.jsbridge.port'])
+
+        self.write('user.js', 'user_pref("extensions.jsbridge.port", 1);\n')
+        self.assertNotEqual(pool.fingerprint(self.profile), fingerprint)
+        self.assertEqual(pool.fingerprint(self.profile,
+                                          ['extensions.jsbridge.port']),
+                         ignoring)
+
+    def test_clone(self):
+        profile_pool = pool.ProfilePool(self.profile, size=1,
+                                        preferences={'extensions.jsbridge.port':
+                                                     1})
+        try:
+            path = profile_pool.get({'extensions.jsbridge.port': 2})
+            try:
+                self.assertTrue(os.path.exists(os.path.join(
+                            path, 'extensions', 'addon', 'install.rdf')))
+                lines = file(os.path.join(path, 'user.js')).readlines()
+                self.assertEqual(lines[-2:],
+                                 ['user_pref("extensions.jsbridge.port", 1);\n',
+                                  'user_pref("extensions.jsbridge.port", 2);\n'])
+            finally:
+                shutil.rmtree(path)
+        finally:
+            profile_pool.close()
+
+
+class TestApplicationPool(unittest.TestCase):
+    """test waiting for the applications of the pool"""
+
+    def create_runner(self, port):
+        self.fail('no application should be started')
+
+    def test_timeout(self):
+        application_pool = pool.ApplicationPool(self.create_runner, size=0,
+                                                timeout=0.1)
+        try:
+            self.assertRaises(Exception, application_pool.get)
+        finally:
+            application_pool.close()
+
+    def test_closed(self):
+        application_pool = pool.ApplicationPool(self.create_runner, size=0)
+        application_pool.close()
+        self.assertRaises(Exception, application_pool.get)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import unittest
+
+from mozmill.records import TestRecord
+
+
+class TestTestRecord(unittest.TestCase):
+    """test the compact representation of test results"""
+
+    def test_record(self):
+        test = {'filename': '/tests/test.js',
+                'name': 'testFoo',
+                'passed': 0,
+                'failed': 1,
+                'passes': [],
+                'fails': [{'exception': {'message': 'failed'}}]}
+        record = TestRecord(test)
+
+        self.assertEqual(record['name'], 'testFoo')
+        self.assertEqual(record['fails'][0]['exception']['message'], 'failed')
+        self.assertFalse('skipped' in record)
+        self.assertEqual(record.get('skipped', False), False)
+        self.assertEqual(record.to_dict(), test)
+
+        record['meta'] = {'bug': 1}
+        self.assertEqual(record['meta'], {'bug': 1})
+
+    def test_interned(self):
+        first = TestRecord({'filename': u'/tests/' + 'test.js'})
+        second = TestRecord({'filename': u'/tests/' + 'test.js'})
+        self.assertTrue(first['filename'] is second['filename'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import unittest
+
+import mozmill
+
+
+class TestShardedResults(unittest.TestCase):
+    """test recording the events forwarded from the shards"""
+
+    def test_forwarded_traffic(self):
+        m = mozmill.ShardedMozMill(2)
+        m.running_test = {'path': 'test1.js'}
+
+        m.dispatch_event('mozmill.setTest', {'filename': 'test1.js',
+                                             'name': 'testFoo'})
+        m.dispatch_event('mozmill.endTest', {'filename': 'test1.js',
+                                             'name': 'testFoo',
+                                             'passed': 1,
+                                             'failed': 0,
+                                             'round_trips': 7,
+                                             'bytes_sent': 100,
+                                             'bytes_received': 200})
+
+        test = m.results.alltests[0]
+        self.assertEqual(test['round_trips'], 7)
+        self.assertEqual(test['bytes_sent'], 100)
+        self.assertEqual(test['bytes_received'], 200)
+
+    def test_forwarded_persisted_deltas(self):
+        m = mozmill.ShardedMozMill(2)
+
+        # the deltas of both shards are based on the same version
+        m.dispatch_event('mozmill.persistDelta', {'base': 0, 'version': 1,
+                                                  'changed': {'foo': 1},
+                                                  'deleted': []})
+        m.dispatch_event('mozmill.persistDelta', {'base': 0, 'version': 1,
+                                                  'changed': {'bar': 2},
+                                                  'deleted': []})
+        self.assertEqual(m.persisted, {'foo': 1, 'bar': 2})
+
+if __name__ == '__main__':
+    unittest.main()
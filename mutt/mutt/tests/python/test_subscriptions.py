@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import logging
+import sys
+import unittest
+
+import mozmill
+
+from mozmill.handlers import EventHandler
+from mozmill.logger import LoggerListener
+
+
+class EndTestHandler(EventHandler):
+    def events(self):
+        return {'mozmill.endTest': self.endTest}
+
+    def endTest(self, test):
+        pass
+
+
+class GlobalHandler(EventHandler):
+    def __call__(self, eventName, obj):
+        pass
+
+
+class TestSubscriptions(unittest.TestCase):
+    """test the event types the application has to send"""
+
+    def setUp(self):
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+        self.logger = logging.getLogger('mozmill')
+        self.handlers = list(self.logger.handlers)
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        self.logger.handlers = self.handlers
+
+    def subscriptions(self, *handlers):
+        return mozmill.MozMill(None, None, handlers=handlers).subscriptions()
+
+    def test_listeners(self):
+        subscriptions = self.subscriptions(EndTestHandler())
+        self.assertTrue('mozmill.endTest' in subscriptions)
+        self.assertTrue('mozmill.userShutdown' in subscriptions)
+        self.assertFalse('mozmill.pass' in subscriptions)
+
+    def test_dropped_events(self):
+        m = mozmill.MozMill(None, None)
+        self.assertTrue('mozmill.droppedEvents' in m.subscriptions())
+
+        m.fire_event('droppedEvents', {'mozmill.pass': 3})
+        m.fire_event('droppedEvents', {'mozmill.pass': 1, 'mozmill.log': 2})
+        self.assertEqual(m.results.dropped_events,
+                         {'mozmill.pass': 4, 'mozmill.log': 2})
+
+    def test_global_listeners(self):
+        self.assertEqual(self.subscriptions(EndTestHandler(), GlobalHandler()),
+                         None)
+
+    def test_logger(self):
+        subscriptions = self.subscriptions(LoggerListener())
+        self.assertTrue('mozmill.frameworkFail' in subscriptions)
+        self.assertFalse('mozmill.pass' in subscriptions)
+
+        self.assertEqual(self.subscriptions(
+                LoggerListener(console_level='DEBUG')), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozmill import trace
+
+
+class TestTracer(unittest.TestCase):
+    """test recording a timeline in the Chrome trace format"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'trace.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_trace(self):
+        tracer = trace.Tracer(self.path)
+        with tracer.span('runner.start'):
+            pass
+        tracer.round_trip('{"op": "set"}', 1., 1.5)
+        tracer.endTest({'filename': 'test.js', 'name': 'testFoo',
+                        'time_start': 2000, 'time_end': 2250})
+        tracer.stop(None, False)
+
+        events = json.load(file(self.path))['traceEvents']
+        spans = dict([(event['name'], event) for event in events
+                      if event['ph'] == 'X'])
+        self.assertEqual(sorted(spans.keys()),
+                         ['bridge', 'runner.start', 'testFoo'])
+        self.assertEqual(spans['bridge']['dur'], 500000)
+        self.assertEqual(spans['testFoo']['ts'], 2000000)
+        self.assertEqual(spans['testFoo']['tid'], trace.JS_THREAD)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import sys
+import unittest
+
+from mozmill import watchdog
+
+
+class FakeMozMill(object):
+    """stands in for a MozMill instance running a test"""
+
+    def __init__(self, process):
+        self.process = process
+        self.running_test = {'path': 'test1.js'}
+        self.current_test = {'filename': 'test1.js', 'name': 'testHang'}
+        self.shutdownMode = {}
+        self.watch_process = True
+        self.round_trips = 0
+
+    def application_process(self):
+        return self.process
+
+    def traffic(self):
+        return (self.round_trips, 0, 0)
+
+
+class TestWatchdog(unittest.TestCase):
+    """test killing applications whose tests don't make progress"""
+
+    def setUp(self):
+        self.process = subprocess.Popen([sys.executable, '-c',
+                                         'import time; time.sleep(60)'])
+        self.mozmill = FakeMozMill(self.process)
+        self.watchdog = watchdog.Watchdog(self.mozmill, 0.5, interval=0.05)
+
+    def tearDown(self):
+        self.watchdog.stop()
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def test_progress(self):
+        self.watchdog.check()
+        self.mozmill.round_trips += 1
+        self.watchdog.last_progress -= 1
+        self.watchdog.check()
+        self.assertEqual(self.watchdog.hang, None)
+        self.assertEqual(self.process.poll(), None)
+
+    def test_hang(self):
+        self.watchdog('mozmill.setTest', self.mozmill.current_test)
+        self.watchdog.start()
+        self.process.wait()
+        self.watchdog.stop()
+
+        hang = self.watchdog.hang
+        self.assertEqual(hang['test'], self.mozmill.current_test)
+        self.assertEqual([event['event'] for event in hang['events']],
+                         ['mozmill.setTest'])
+        self.assertTrue(hang['idle'] >= 0.5)
+        self.assertEqual(hang['pid'], self.process.pid)
+
+    def test_cpu_time(self):
+        if not os.path.exists('/proc/self/stat'):
+            return
+        self.assertTrue(watchdog.cpu_time(os.getpid()) >= 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,5 +25,23 @@ class TestMozmillAPI(unittest.TestCase):
         results = m.run([dict(path=path)])
         self.assertTrue(len(results.passes) == passes)
 
+    def test_runtwice_pool(self):
+        passes = 4
+        path = self.make_test()
+        m = mozmill.MozMill.create(profile_pool=1, application_pool=1)
+        m.run([dict(path=path), dict(path=path)], restart=True)
+        self.assertTrue(m.profile_pool is None)
+        self.assertTrue(m.application_pool is None)
+        results = m.run([dict(path=path), dict(path=path)], restart=True)
+        self.assertTrue(len(results.passes) == passes)
+
+    def test_startupinfo(self):
+        path = self.make_test()
+        for i in range(2):
+            # the second run takes the application info from the cache
+            m = mozmill.MozMill.create()
+            results = m.run([dict(path=path)])
+            self.assertTrue('startupinfo' in results.appinfo)
+
 if __name__ == '__main__':
     unittest.main()
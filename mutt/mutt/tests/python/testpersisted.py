@@ -51,6 +51,24 @@ class TestMozmillPersisted(unittest.TestCase):
         self.assertTrue(len(results.passes) == 1)
         self.inspect_persisted(m.persisted)
 
+    def test_persisted_delta(self):
+        m = mozmill.MozMill(None, None)
+        m.persisted['foo'] = 'bar'
+        m.persisted_version = 1
+
+        # a delta based on another version is ignored
+        m.dispatch_event('mozmill.persistDelta', {'base': 0, 'version': 1,
+                                                  'changed': {'bar': 'bar'},
+                                                  'deleted': ['foo']})
+        self.assertEqual(m.persisted, {'foo': 'bar'})
+        self.assertEqual(m.persisted_version, 1)
+
+        m.dispatch_event('mozmill.persistDelta', {'base': 1, 'version': 2,
+                                                  'changed': {'bar': 'bar'},
+                                                  'deleted': ['foo']})
+        self.assertEqual(m.persisted, {'bar': 'bar'})
+        self.assertEqual(m.persisted_version, 2)
+
     def inspect_persisted(self, persisted):
         """inspect the persisted data following the test"""
         self.assertTrue(persisted == {u'fleem': 2,